@@ -1,12 +1,140 @@
-from flask import Blueprint, request, jsonify, session
-from werkzeug.security import generate_password_hash, check_password_hash
-from auth import login_required, role_required, login_user, logout_user, current_user
-from db import query_one, query_all, execute
+import base64
+import binascii
+import csv
+import hashlib
+import io
+import json
+from datetime import datetime, timezone
+from flask import Blueprint, Response, current_app, request, jsonify, session, make_response
+from auth import (login_required, role_required, telemetry_auth_required, login_user, logout_user, current_user,
+                  check_login_attempt, login_failed, login_succeeded, LoginThrottled)
+from config import Config
+from db import (query_one, query_all, query_rows, execute, stream, transaction, pool_stats, replica_stats,
+                pool_ready)
+import dashboard
+import hashing
+import metrics
+import live
+import refcache
+import rollup
+import serialization
+import telemetry
+import tracks as tracks_util
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
+# Formati disponibili per le tracce GPS
+TRACK_FORMATS = {
+    'json': 'application/json',
+    'polyline': tracks_util.POLYLINE_MIMETYPE,
+    'binary': tracks_util.BINARY_MIMETYPE
+}
+
+# ===== CACHE HTTP =====
+
+def _not_modified(etag, last_modified=None):
+    """Verifica se il client possiede già la versione corrente (If-None-Match / If-Modified-Since)"""
+    if request.if_none_match:
+        # Confronto debole: le risposte compresse hanno ETag W/"..."
+        return request.if_none_match.contains_weak(etag)
+    if last_modified and request.if_modified_since:
+        last = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        return last <= request.if_modified_since
+    return False
+
+def _not_modified_response(etag, last_modified=None):
+    """Risposta 304 senza corpo con gli stessi validatori della risorsa"""
+    response = make_response('', 304)
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+def _track_format():
+    """Formato della traccia da ?format= o, in mancanza, dall'header Accept"""
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt
+    best = request.accept_mimetypes.best_match(list(TRACK_FORMATS.values()))
+    return next((name for name, mimetype in TRACK_FORMATS.items() if mimetype == best), 'json')
+
+# ===== PAGINAZIONE =====
+
+def _page_limit():
+    """Dimensione pagina da ?limit=, limitata a PAGE_SIZE_MAX"""
+    limit = request.args.get('limit', Config.PAGE_SIZE, type=int)
+    return max(1, min(limit, Config.PAGE_SIZE_MAX))
+
+def _encode_cursor(values):
+    """Cursore opaco con le chiavi di ordinamento dell'ultima riga"""
+    raw = json.dumps([v if v is None or isinstance(v, int) else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor, size):
+    """Decodifica un cursore di `size` chiavi; ValueError se non valido"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError('Cursore non valido') from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Cursore non valido')
+    return values
+
+# Minimo di ogni tipo: le chiavi NULL restano in fondo all'ordine DESC senza uscire dal confronto
+_NULL_KEYS = {
+    'DATETIME': "'1000-01-01 00:00:00'",
+    'DATE': "'1000-01-01'",
+    'TIME': "'-838:59:59'"
+}
+
+def _sort_key(expr, sql_type):
+    """Chiave di ordinamento mai NULL: il confronto di riga (a, b) < (x, y) con un NULL
+    non è né vero né falso e scarterebbe la riga; va usata sia in ORDER BY che nel confronto"""
+    return f"COALESCE({expr}, CAST({_NULL_KEYS[sql_type]} AS {sql_type}))"
+
+def _page(rows, limit, keys):
+    """Risposta paginata: le righe in più oltre il limite indicano la pagina successiva"""
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = _encode_cursor([last[k] for k in keys])
+    return {'items': items, 'next_cursor': next_cursor}
+
+# ===== HEALTH CHECK (load balancer, senza autenticazione) =====
+
+POOL_HEALTH_FIELDS = ('size', 'max_overflow', 'in_use', 'idle', 'waiters')
+
+@api.route('/health/live', methods=['GET'])
+def health_live():
+    """Liveness: il processo risponde, senza toccare il database"""
+    return jsonify({'status': 'ok'}), 200
+
+@api.route('/health/ready', methods=['GET'])
+def health_ready():
+    """Readiness: primario raggiungibile con connessioni aperte e coda di attesa non piena"""
+    try:
+        stats = pool_ready()
+    except Exception:
+        # Il messaggio del driver contiene host e porta del database: solo nel log
+        current_app.logger.exception('Readiness: database non raggiungibile')
+        return jsonify({'status': 'unavailable'}), 503
+    pool = {field: stats[field] for field in POOL_HEALTH_FIELDS}
+    # Endpoint pubblico: solo conteggi, i nomi delle repliche restano in /api/admin/db
+    healthy = [r['healthy'] for r in replica_stats()]
+    replicas = {'total': len(healthy), 'healthy': sum(healthy)}
+    if stats['waiters'] >= Config.DB_POOL_MAX_WAITERS:
+        return jsonify({'status': 'saturated', 'pool': pool, 'replicas': replicas}), 503
+    return jsonify({'status': 'ready', 'pool': pool, 'replicas': replicas}), 200
+
 # ===== AUTENTICAZIONE =====
 
+def _retry_later(message, status, seconds):
+    """Risposta di errore con header Retry-After"""
+    response = jsonify({'error': message})
+    response.headers['Retry-After'] = str(seconds)
+    return response, status
+
 @api.route('/auth/register', methods=['POST'])
 def register():
     """Registrazione nuovo utente"""
@@ -19,13 +147,16 @@ def register():
         if not all([name, email, password]):
             return jsonify({'error': 'Tutti i campi sono obbligatori'}), 400
         
+        check_login_attempt(request.remote_addr)
+        
         # Verifica se email esiste già
         existing = query_one("SELECT ID FROM Utente WHERE Mail = %s", (email,))
         if existing:
+            login_failed(request.remote_addr)
             return jsonify({'error': 'Email già registrata'}), 400
         
         # Crea utente
-        hashed = generate_password_hash(password)
+        hashed = hashing.hash_password(password)
         user_id = execute(
             "INSERT INTO Utente (Nome, Mail, Password, Ruolo) VALUES (%s, %s, %s, %s)",
             (name, email, hashed, 'cliente')
@@ -41,6 +172,10 @@ def register():
         login_user(user_data)
         
         return jsonify(user_data), 201
+    except LoginThrottled as e:
+        return _retry_later(str(e), 429, e.retry_after)
+    except hashing.HashingBusy as e:
+        return _retry_later(str(e), 503, 1)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -55,14 +190,27 @@ def login():
         if not all([email, password]):
             return jsonify({'error': 'Email e password obbligatorie'}), 400
         
+        check_login_attempt(request.remote_addr, email)
+        
         # Trova utente
         user = query_one("SELECT ID, Nome, Mail, Password, Ruolo FROM Utente WHERE Mail = %s", (email,))
         if not user:
+            login_failed(request.remote_addr, email)
             return jsonify({'error': 'Credenziali non valide'}), 401
         
         # Verifica password
-        if not check_password_hash(user['Password'], password):
+        if not hashing.check_password(user['Password'], password):
+            login_failed(request.remote_addr, email)
             return jsonify({'error': 'Credenziali non valide'}), 401
+        login_succeeded(email)
+        
+        # Hash con parametri non più attuali: rigenerato ora che la password è nota
+        try:
+            if hashing.needs_rehash(user['Password']):
+                execute("UPDATE Utente SET Password = %s WHERE ID = %s",
+                        (hashing.hash_password(password), user['ID']))
+        except hashing.HashingBusy:
+            pass  # si riprova al prossimo login
         
         # Normalizza ruolo
         role = 'admin' if user['Ruolo'] == 'admin' else 'customer'
@@ -77,6 +225,10 @@ def login():
         login_user(user_data)
         
         return jsonify(user_data), 200
+    except LoginThrottled as e:
+        return _retry_later(str(e), 429, e.retry_after)
+    except hashing.HashingBusy as e:
+        return _retry_later(str(e), 503, 1)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -100,10 +252,13 @@ def me():
 @login_required
 @role_required('customer')
 def get_orders():
-    """Lista ordini del cliente"""
+    """Lista ordini del cliente, paginata per (Orario, ID) con ?cursor= e ?limit="""
     try:
         user = current_user()
-        orders = query_all("""
+        limit = _page_limit()
+        cursor = request.args.get('cursor')
+        
+        query = """
             SELECT 
                 o.ID as id,
                 o.Tipo as type,
@@ -115,12 +270,92 @@ def get_orders():
             FROM Ordine o
             LEFT JOIN Missione m ON o.ID_Missione = m.ID
             WHERE o.ID_Utente = %s
-            ORDER BY o.Orario DESC
-        """, (user['id'],))
-        return jsonify(orders), 200
+        """
+        params = [user['id']]
+        orario = _sort_key('o.Orario', 'DATETIME')
+        
+        # Keyset: solo le righe successive all'ultima della pagina precedente
+        if cursor:
+            try:
+                params.extend(_decode_cursor(cursor, 2))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query += f" AND ({orario}, o.ID) < ({_sort_key('%s', 'DATETIME')}, %s)"
+        
+        query += f" ORDER BY {orario} DESC, o.ID DESC LIMIT %s"
+        params.append(limit + 1)
+        
+        orders = query_all(query, tuple(params))
+        return jsonify(_page(orders, limit, ['scheduled_at', 'id'])), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Ordine, prodotti e missione in un solo result set (una riga per prodotto)
+ORDER_DETAIL_QUERY = """
+    SELECT 
+        o.ID as id,
+        o.Tipo as type,
+        o.PesoTotale as total_weight,
+        o.Orario as scheduled_at,
+        o.IndirizzoDestinazione as address,
+        o.ID_Missione as mission_id,
+        o.ID_Utente as user_id,
+        p.ID as product_id,
+        p.nome as product_name,
+        c.Quantita as product_quantity,
+        p.peso as product_weight,
+        m.ID as mission_ref,
+        m.Stato as mission_status,
+        d.Modello as mission_drone,
+        CONCAT(pi.Nome, ' ', pi.Cognome) as mission_pilot
+    FROM Ordine o
+    LEFT JOIN Contiene c ON c.ID_Ordine = o.ID
+    LEFT JOIN Prodotto p ON c.ID_Prodotto = p.ID
+    LEFT JOIN Missione m ON o.ID_Missione = m.ID
+    LEFT JOIN Drone d ON m.IdDrone = d.ID
+    LEFT JOIN Pilota pi ON m.IdPilota = pi.ID
+    WHERE o.ID_Utente = %s AND o.ID IN ({ids})
+    ORDER BY o.ID
+"""
+
+def _order_details(user_id, order_ids):
+    """Dettagli di più ordini dell'utente in un round trip, raggruppati in Python"""
+    rows = query_all(
+        ORDER_DETAIL_QUERY.format(ids=', '.join(['%s'] * len(order_ids))),
+        (user_id, *order_ids)
+    )
+    
+    details = {}
+    for row in rows:
+        detail = details.get(row['id'])
+        if detail is None:
+            detail = details[row['id']] = {
+                'order': {
+                    'id': row['id'],
+                    'type': row['type'],
+                    'total_weight': row['total_weight'],
+                    'scheduled_at': row['scheduled_at'],
+                    'address': row['address'],
+                    'mission_id': row['mission_id'],
+                    'user_id': row['user_id']
+                },
+                'products': [],
+                'mission': {
+                    'id': row['mission_ref'],
+                    'status': row['mission_status'],
+                    'drone': row['mission_drone'],
+                    'pilot': row['mission_pilot']
+                } if row['mission_ref'] else None
+            }
+        if row['product_id'] is not None:
+            detail['products'].append({
+                'id': row['product_id'],
+                'name': row['product_name'],
+                'quantity': row['product_quantity'],
+                'weight': row['product_weight']
+            })
+    return details
+
 @api.route('/orders/<int:order_id>', methods=['GET'])
 @login_required
 @role_required('customer')
@@ -129,56 +364,36 @@ def get_order_detail(order_id):
     try:
         user = current_user()
         
-        # Verifica proprietà ordine
-        order = query_one("""
-            SELECT 
-                o.ID as id,
-                o.Tipo as type,
-                o.PesoTotale as total_weight,
-                o.Orario as scheduled_at,
-                o.IndirizzoDestinazione as address,
-                o.ID_Missione as mission_id,
-                o.ID_Utente as user_id
-            FROM Ordine o
-            WHERE o.ID = %s
-        """, (order_id,))
-        
-        if not order or order['user_id'] != user['id']:
+        # Solo ordini dell'utente
+        detail = _order_details(user['id'], [order_id]).get(order_id)
+        if not detail:
             return jsonify({'error': 'Ordine non trovato'}), 404
         
-        # Prodotti
-        products = query_all("""
-            SELECT 
-                p.ID as id,
-                p.nome as name,
-                c.Quantita as quantity,
-                p.peso as weight
-            FROM Contiene c
-            JOIN Prodotto p ON c.ID_Prodotto = p.ID
-            WHERE c.ID_Ordine = %s
-        """, (order_id,))
-        
-        # Missione
-        mission = None
-        if order['mission_id']:
-            mission_data = query_one("""
-                SELECT 
-                    m.ID as id,
-                    m.Stato as status,
-                    d.Modello as drone,
-                    CONCAT(pi.Nome, ' ', pi.Cognome) as pilot
-                FROM Missione m
-                LEFT JOIN Drone d ON m.IdDrone = d.ID
-                LEFT JOIN Pilota pi ON m.IdPilota = pi.ID
-                WHERE m.ID = %s
-            """, (order['mission_id'],))
-            mission = mission_data
-        
-        return jsonify({
-            'order': order,
-            'products': products,
-            'mission': mission
-        }), 200
+        return jsonify(detail), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/orders/details', methods=['GET'])
+@login_required
+@role_required('customer')
+def get_order_details():
+    """Dettagli di più ordini (?ids=1,2,3) per il prefetch della lista"""
+    try:
+        user = current_user()
+        
+        try:
+            order_ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+        except ValueError:
+            return jsonify({'error': 'ids non validi'}), 400
+        
+        if not order_ids:
+            return jsonify({'error': 'Nessun ordine richiesto'}), 400
+        
+        if len(order_ids) > Config.PAGE_SIZE_MAX:
+            return jsonify({'error': f'Massimo {Config.PAGE_SIZE_MAX} ordini per richiesta'}), 400
+        
+        details = _order_details(user['id'], order_ids)
+        return jsonify([details[i] for i in order_ids if i in details]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -214,8 +429,8 @@ def get_mission(mission_id):
         # Formatta risposta
         result = {
             'id': mission['id'],
-            'date': str(mission['date']) if mission['date'] else None,
-            'time': str(mission['time']) if mission['time'] else None,
+            'date': mission['date'],
+            'time': mission['time'],
             'status': mission['status'],
             'rating': mission['rating'],
             'comment': mission['comment'],
@@ -239,26 +454,117 @@ def get_mission(mission_id):
 @login_required
 @role_required('customer')
 def get_mission_tracks(mission_id):
-    """Tracce GPS della missione"""
+    """Tracce GPS della missione, incrementali con ?since=, semplificate con ?zoom= o ?tolerance=
+    e in formato compatto con ?format=polyline|binary (o header Accept)"""
     try:
-        tracks = query_all("""
+        since = request.args.get('since')
+        zoom = request.args.get('zoom', type=int)
+        tolerance = request.args.get('tolerance', type=float)
+        fmt = _track_format()
+        
+        if fmt not in TRACK_FORMATS:
+            return jsonify({'error': 'Formato non supportato'}), 400
+        
+        if zoom is not None:
+            if not (0 <= zoom <= 22):
+                return jsonify({'error': 'Zoom deve essere tra 0 e 22'}), 400
+            tolerance = tracks_util.tolerance_for_zoom(zoom)
+        
+        # Stato della traccia (validatori HTTP) e della missione in un solo round trip
+        state = query_one("""
             SELECT 
-                Latitudine as lat,
-                Longitudine as lng,
-                TIMESTAMP as timestamp
+                COUNT(*) as count,
+                MAX(TIMESTAMP) as last,
+                (SELECT Stato FROM Missione WHERE ID = %s) as status
             FROM Traccia
             WHERE ID_Missione = %s
-            ORDER BY TIMESTAMP ASC
-        """, (mission_id,))
+        """, (mission_id, mission_id))
+        # Ogni combinazione di formato, tolleranza e cursore è una rappresentazione diversa;
+        # il cursore (testo del client) entra nell'ETag come hash
+        etag = f"track-{mission_id}-{state['count']}-{state['last']}-{fmt}-{tolerance or 0}"
+        if since:
+            etag += '-' + hashlib.sha1(since.encode()).hexdigest()[:16]
+        last_modified = state['last']
+        
+        # Nessun nuovo punto rispetto alla versione del client
+        if _not_modified(etag, last_modified):
+            return _not_modified_response(etag, last_modified)
+        
+        # Le missioni concluse non cambiano più: la traccia semplificata è in cache
+        cache_key = (mission_id, tolerance, fmt)
+        cacheable = tolerance and not since and state['status'] in live.TERMINAL_STATES
+        cached = tracks_util.cache_get(cache_key, etag) if cacheable else None
         
-        # Converti timestamp in stringhe
-        for track in tracks:
-            track['timestamp'] = str(track['timestamp']) if track['timestamp'] else None
+        if cached is None:
+            query = """
+                SELECT 
+                    Latitudine as lat,
+                    Longitudine as lng,
+                    TIMESTAMP as timestamp
+                FROM Traccia
+                WHERE ID_Missione = %s
+            """
+            params = [mission_id]
+            
+            # Punti successivi al cursore del client, più una finestra prima del cursore per quelli
+            # scritti in ritardo: il client scarta quelli che ha già
+            if since:
+                query += " AND TIMESTAMP > DATE_SUB(%s, INTERVAL %s SECOND)"
+                params.extend((since, Config.TRACK_LATE_WINDOW))
+            
+            query += " ORDER BY TIMESTAMP ASC"
+            
+            if fmt == 'json':
+                tracks = query_all(query, tuple(params))
+                
+                if tolerance:
+                    tracks = tracks_util.simplify(tracks, tolerance)
+                
+                cached = (current_app.json.dumps(tracks), 'application/json', None)
+            else:
+                # Formati compatti: colonne NumPy direttamente dalle tuple del cursore
+                rows = query_rows(query, tuple(params))
+                last = str(rows[-1][2]) if rows else None
+                lat, lng, secs = tracks_util.columns(rows, tolerance)
+                
+                if fmt == 'polyline':
+                    payload = tracks_util.encode_polyline(lat, lng, secs)
+                    payload['last'] = last
+                    cached = (current_app.json.dumps(payload), tracks_util.POLYLINE_MIMETYPE, last)
+                else:
+                    cached = (tracks_util.encode_binary(lat, lng, secs), tracks_util.BINARY_MIMETYPE, last)
+            
+            if cacheable:
+                tracks_util.cache_put(cache_key, etag, cached)
         
-        return jsonify(tracks), 200
+        body, mimetype, last = cached
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        if last:
+            response.headers['X-Track-Last'] = last
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Accept')
+        return response, 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/missions/<int:mission_id>/tracks/stream', methods=['GET'])
+@login_required
+@role_required('customer')
+def stream_mission_tracks(mission_id):
+    """Stream SSE di nuovi punti e cambi di stato della missione"""
+    if not Config.LIVE_SSE:
+        # Il client ripiega sul polling incrementale di /tracks
+        return jsonify({'error': 'Stream non disponibile'}), 503
+    subscriber = live.subscribe(mission_id)
+    return Response(
+        live.stream(mission_id, subscriber),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @api.route('/missions/<int:mission_id>/rating', methods=['POST'])
 @login_required
 @role_required('customer')
@@ -272,73 +578,243 @@ def rate_mission(mission_id):
         if not rating or not (1 <= int(rating) <= 10):
             return jsonify({'error': 'Valutazione deve essere tra 1 e 10'}), 400
         
-        # Verifica che missione sia completata
-        mission = query_one("SELECT Stato FROM Missione WHERE ID = %s", (mission_id,))
-        if not mission:
-            return jsonify({'error': 'Missione non trovata'}), 404
+        with transaction():
+            # Verifica che missione sia completata (riga bloccata fino al commit)
+            mission = query_one("SELECT Stato, Valutazione FROM Missione WHERE ID = %s FOR UPDATE", (mission_id,))
+            if not mission:
+                return jsonify({'error': 'Missione non trovata'}), 404
+            
+            if mission['Stato'] != 'completata':
+                return jsonify({'error': 'Puoi valutare solo missioni completate'}), 400
+            
+            # Aggiorna valutazione
+            execute(
+                "UPDATE Missione SET Valutazione = %s, Commento = %s WHERE ID = %s",
+                (rating, comment, mission_id)
+            )
+        dashboard.mission_rated(mission['Valutazione'], rating)
+        
+        return jsonify({'message': 'Valutazione salvata'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ===== TELEMETRIA =====
+
+def _parse_telemetry_point(point):
+    """Valida un punto di telemetria e lo converte in riga per Traccia"""
+    lat = float(point['lat'])
+    lng = float(point['lng'])
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('coordinate fuori intervallo')
+    
+    timestamp = point.get('timestamp')
+    if timestamp:
+        timestamp = datetime.fromisoformat(timestamp)
+        if timestamp.tzinfo:
+            timestamp = timestamp.astimezone().replace(tzinfo=None)
+    else:
+        timestamp = datetime.now()
+    
+    return (int(point['drone_id']), int(point['mission_id']), lat, lng, timestamp)
+
+@api.route('/telemetry', methods=['POST'])
+@telemetry_auth_required
+def ingest_telemetry():
+    """Ingestione a lotti di punti GPS da più droni"""
+    try:
+        data = request.get_json(silent=True)
+        points = data.get('points') if isinstance(data, dict) else data
         
-        if mission['Stato'] != 'completata':
-            return jsonify({'error': 'Puoi valutare solo missioni completate'}), 400
+        if not isinstance(points, list) or not points:
+            return jsonify({'error': 'Nessun punto ricevuto'}), 400
         
-        # Aggiorna valutazione
-        execute(
-            "UPDATE Missione SET Valutazione = %s, Commento = %s WHERE ID = %s",
-            (rating, comment, mission_id)
-        )
+        if len(points) > Config.TELEMETRY_MAX_BATCH:
+            return jsonify({'error': f'Massimo {Config.TELEMETRY_MAX_BATCH} punti per richiesta'}), 413
         
-        return jsonify({'message': 'Valutazione salvata'}), 200
+        rows = []
+        for index, point in enumerate(points):
+            try:
+                rows.append(_parse_telemetry_point(point))
+            except (KeyError, TypeError, ValueError) as e:
+                return jsonify({'error': f'Punto {index} non valido: {e}'}), 400
+        
+        # Buffer pieno: il client deve riprovare più tardi
+        if not telemetry.submit(rows):
+            response = jsonify({'error': 'Coda telemetria piena, riprovare'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        
+        return jsonify({'accepted': len(rows)}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # ===== API ADMIN =====
 
+# Colonne delle missioni, nell'ordine di SELECT, usate anche per l'esportazione
+MISSION_COLUMNS = ['id', 'date', 'time', 'status', 'rating', 'drone_model', 'pilot_name']
+EXPORT_COLUMNS = ['id', 'date', 'time', 'drone_model', 'pilot_name', 'status', 'rating']
+EXPORT_HEADERS = ['ID', 'Data', 'Ora', 'Drone', 'Pilota', 'Stato', 'Valutazione']
+EXPORT_CHUNK_ROWS = 500
+
+def _missions_query():
+    """Query missioni con i filtri di ?stato, ?pilota_id, ?drone_id, ?dal, ?al"""
+    stato = request.args.get('stato')
+    pilota_id = request.args.get('pilota_id')
+    drone_id = request.args.get('drone_id')
+    dal = request.args.get('dal')
+    al = request.args.get('al')
+    
+    # Query base
+    query = """
+        SELECT 
+            m.ID as id,
+            m.DataMissione as date,
+            m.Ora as time,
+            m.Stato as status,
+            m.Valutazione as rating,
+            d.Modello as drone_model,
+            CONCAT(pi.Nome, ' ', pi.Cognome) as pilot_name
+        FROM Missione m
+        LEFT JOIN Drone d ON m.IdDrone = d.ID
+        LEFT JOIN Pilota pi ON m.IdPilota = pi.ID
+        WHERE 1=1
+    """
+    params = []
+    
+    # Filtri
+    if stato:
+        query += " AND m.Stato = %s"
+        params.append(stato)
+    
+    if pilota_id:
+        query += " AND m.IdPilota = %s"
+        params.append(int(pilota_id))
+    
+    if drone_id:
+        query += " AND m.IdDrone = %s"
+        params.append(int(drone_id))
+    
+    if dal:
+        query += " AND m.DataMissione >= %s"
+        params.append(dal)
+    
+    if al:
+        query += " AND m.DataMissione <= %s"
+        params.append(al)
+    
+    return query, params
+
+def _missions_csv(rows):
+    """Genera il CSV a blocchi; l'intestazione parte prima che la query sia eseguita"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    def drain():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+    
+    writer.writerow(EXPORT_HEADERS)
+    yield drain()
+    
+    for count, row in enumerate(rows, 1):
+        mission = dict(zip(MISSION_COLUMNS, row))
+        writer.writerow(['' if mission[c] is None else mission[c] for c in EXPORT_COLUMNS])
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield drain()
+    yield drain()
+
+def _missions_ndjson(rows):
+    """Genera una riga JSON per missione, a blocchi"""
+    chunk = []
+    for row in rows:
+        chunk.append(serialization.dumps(dict(zip(MISSION_COLUMNS, row))))
+        if len(chunk) == EXPORT_CHUNK_ROWS:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
 @api.route('/admin/dashboard', methods=['GET'])
 @login_required
 @role_required('admin')
 def admin_dashboard():
     """KPI dashboard admin"""
     try:
-        # Missioni in corso
-        in_progress = query_one("SELECT COUNT(*) as count FROM Missione WHERE Stato = 'in corso'")
-        
-        # Missioni completate
-        completed = query_one("SELECT COUNT(*) as count FROM Missione WHERE Stato = 'completata'")
-        
-        # Missioni annullate
-        cancelled = query_one("SELECT COUNT(*) as count FROM Missione WHERE Stato = 'annullata'")
-        
-        # Peso medio ordini
-        avg_weight = query_one("SELECT AVG(PesoTotale) as avg FROM Ordine")
-        
-        # Voto medio
-        avg_rating = query_one("SELECT AVG(Valutazione) as avg FROM Missione WHERE Valutazione IS NOT NULL")
-        
-        return jsonify({
-            'missions_in_progress': in_progress['count'] if in_progress else 0,
-            'missions_completed': completed['count'] if completed else 0,
-            'missions_cancelled': cancelled['count'] if cancelled else 0,
-            'avg_order_weight': round(float(avg_weight['avg']), 2) if avg_weight['avg'] else 0,
-            'avg_rating': round(float(avg_rating['avg']), 2) if avg_rating['avg'] else 0
-        }), 200
+        return jsonify(dashboard.get_kpis()), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/admin/telemetry', methods=['GET'])
+@login_required
+@role_required('admin')
+def telemetry_stats():
+    """Contatori di ingestione telemetria"""
+    return jsonify(telemetry.stats()), 200
+
+@api.route('/admin/db', methods=['GET'])
+@login_required
+@role_required('admin')
+def db_stats():
+    """Stato del pool di connessioni DB e delle repliche"""
+    return jsonify({'pool': pool_stats(), 'replicas': replica_stats()}), 200
+
+@api.route('/admin/metrics', methods=['GET'])
+@login_required
+@role_required('admin')
+def get_metrics():
+    """Metriche di richieste, query e pool nel formato Prometheus"""
+    return Response(metrics.render(pool_stats()), mimetype='text/plain; version=0.0.4')
+
+# ===== LISTE DI RIFERIMENTO (droni, piloti) =====
+
+# Sul primario: una replica in ritardo fisserebbe in cache dati vecchi sotto la nuova versione
+def _load_drones():
+    return query_all("""
+        SELECT 
+            ID as id,
+            Modello as model,
+            Batteria as battery,
+            Capacita as capacity
+        FROM Drone
+        ORDER BY ID
+    """, primary=True)
+
+def _load_pilots():
+    return query_all("""
+        SELECT 
+            ID as id,
+            Nome as name,
+            Cognome as surname,
+            Turno as shift,
+            Brevetto as license
+        FROM Pilota
+        ORDER BY ID
+    """, primary=True)
+
+def _reference_list(name, loader):
+    """Risposta da refcache con ETag forte e 304 se il client ha già la versione corrente.
+    La variante gzip è precompressa in refcache: gzip_response non la tocca e l'ETag resta forte"""
+    etag, body, encoding = refcache.get(name, loader, 'gzip' in request.accept_encodings)
+    if _not_modified(etag):
+        response = _not_modified_response(etag)
+    else:
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
 @api.route('/admin/drones', methods=['GET'])
 @login_required
 @role_required('admin')
 def get_drones():
-    """Lista droni"""
+    """Lista droni (cache versionata: 304 o corpo già serializzato finché non cambia)"""
     try:
-        drones = query_all("""
-            SELECT 
-                ID as id,
-                Modello as model,
-                Batteria as battery,
-                Capacita as capacity
-            FROM Drone
-            ORDER BY ID
-        """)
-        return jsonify(drones), 200
+        return _reference_list('drones', _load_drones)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -360,6 +836,7 @@ def create_drone():
             "INSERT INTO Drone (Modello, Batteria, Capacita) VALUES (%s, %s, %s)",
             (model, battery, capacity)
         )
+        refcache.bump('drones')
         
         return jsonify({'id': drone_id, 'message': 'Drone creato'}), 201
     except Exception as e:
@@ -383,6 +860,7 @@ def update_drone(drone_id):
             "UPDATE Drone SET Modello = %s, Batteria = %s, Capacita = %s WHERE ID = %s",
             (model, battery, capacity, drone_id)
         )
+        refcache.bump('drones')
         
         return jsonify({'message': 'Drone aggiornato'}), 200
     except Exception as e:
@@ -395,6 +873,7 @@ def delete_drone(drone_id):
     """Elimina drone"""
     try:
         execute("DELETE FROM Drone WHERE ID = %s", (drone_id,))
+        refcache.bump('drones')
         return jsonify({'message': 'Drone eliminato'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -403,19 +882,9 @@ def delete_drone(drone_id):
 @login_required
 @role_required('admin')
 def get_pilots():
-    """Lista piloti"""
+    """Lista piloti (cache versionata: 304 o corpo già serializzato finché non cambia)"""
     try:
-        pilots = query_all("""
-            SELECT 
-                ID as id,
-                Nome as name,
-                Cognome as surname,
-                Turno as shift,
-                Brevetto as license
-            FROM Pilota
-            ORDER BY ID
-        """)
-        return jsonify(pilots), 200
+        return _reference_list('pilots', _load_pilots)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -438,6 +907,7 @@ def create_pilot():
             "INSERT INTO Pilota (Nome, Cognome, Turno, Brevetto) VALUES (%s, %s, %s, %s)",
             (name, surname, shift, license)
         )
+        refcache.bump('pilots')
         
         return jsonify({'id': pilot_id, 'message': 'Pilota creato'}), 201
     except Exception as e:
@@ -462,6 +932,7 @@ def update_pilot(pilot_id):
             "UPDATE Pilota SET Nome = %s, Cognome = %s, Turno = %s, Brevetto = %s WHERE ID = %s",
             (name, surname, shift, license, pilot_id)
         )
+        refcache.bump('pilots')
         
         return jsonify({'message': 'Pilota aggiornato'}), 200
     except Exception as e:
@@ -474,6 +945,7 @@ def delete_pilot(pilot_id):
     """Elimina pilota"""
     try:
         execute("DELETE FROM Pilota WHERE ID = %s", (pilot_id,))
+        refcache.bump('pilots')
         return jsonify({'message': 'Pilota eliminato'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -482,63 +954,60 @@ def delete_pilot(pilot_id):
 @login_required
 @role_required('admin')
 def get_missions():
-    """Lista missioni con filtri"""
+    """Lista missioni con filtri, paginata per (DataMissione, Ora, ID) con ?cursor= e ?limit="""
     try:
-        # Parametri filtro
-        stato = request.args.get('stato')
-        pilota_id = request.args.get('pilota_id')
-        drone_id = request.args.get('drone_id')
-        dal = request.args.get('dal')
-        al = request.args.get('al')
-        
-        # Query base
-        query = """
-            SELECT 
-                m.ID as id,
-                m.DataMissione as date,
-                m.Ora as time,
-                m.Stato as status,
-                m.Valutazione as rating,
-                d.Modello as drone_model,
-                CONCAT(pi.Nome, ' ', pi.Cognome) as pilot_name
-            FROM Missione m
-            LEFT JOIN Drone d ON m.IdDrone = d.ID
-            LEFT JOIN Pilota pi ON m.IdPilota = pi.ID
-            WHERE 1=1
-        """
-        params = []
+        limit = _page_limit()
+        cursor = request.args.get('cursor')
         
-        # Filtri
-        if stato:
-            query += " AND m.Stato = %s"
-            params.append(stato)
+        query, params = _missions_query()
+        data, ora = _sort_key('m.DataMissione', 'DATE'), _sort_key('m.Ora', 'TIME')
         
-        if pilota_id:
-            query += " AND m.IdPilota = %s"
-            params.append(int(pilota_id))
+        # Keyset: solo le righe successive all'ultima della pagina precedente
+        if cursor:
+            try:
+                params.extend(_decode_cursor(cursor, 3))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query += (f" AND ({data}, {ora}, m.ID)"
+                      f" < ({_sort_key('%s', 'DATE')}, {_sort_key('%s', 'TIME')}, %s)")
         
-        if drone_id:
-            query += " AND m.IdDrone = %s"
-            params.append(int(drone_id))
+        query += f" ORDER BY {data} DESC, {ora} DESC, m.ID DESC LIMIT %s"
+        params.append(limit + 1)
         
-        if dal:
-            query += " AND m.DataMissione >= %s"
-            params.append(dal)
+        missions = query_all(query, tuple(params))
         
-        if al:
-            query += " AND m.DataMissione <= %s"
-            params.append(al)
+        return jsonify(_page(missions, limit, ['date', 'time', 'id'])), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/admin/missions/export', methods=['GET'])
+@login_required
+@role_required('admin')
+def export_missions():
+    """Esportazione in streaming delle missioni filtrate (?format=csv|ndjson)"""
+    try:
+        fmt = request.args.get('format', 'csv')
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({'error': 'Formato non supportato'}), 400
         
-        query += " ORDER BY m.DataMissione DESC, m.Ora DESC"
+        query, params = _missions_query()
+        query += " ORDER BY m.DataMissione DESC, m.Ora DESC, m.ID DESC"
         
-        missions = query_all(query, tuple(params))
+        # Le righe arrivano da un cursore non bufferizzato: memoria costante
+        rows = stream(query, tuple(params))
         
-        # Converti date in stringhe
-        for mission in missions:
-            mission['date'] = str(mission['date']) if mission['date'] else None
-            mission['time'] = str(mission['time']) if mission['time'] else None
+        if fmt == 'csv':
+            body = _missions_csv(rows)
+            mimetype = 'text/csv'
+        else:
+            body = _missions_ndjson(rows)
+            mimetype = 'application/x-ndjson'
         
-        return jsonify(missions), 200
+        filename = f"missioni_{datetime.now().date()}.{fmt}"
+        return Response(body, mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -554,10 +1023,19 @@ def update_mission_status(mission_id):
         if status not in ['in corso', 'completata', 'annullata']:
             return jsonify({'error': 'Stato non valido'}), 400
         
-        execute(
-            "UPDATE Missione SET Stato = %s WHERE ID = %s",
-            (status, mission_id)
-        )
+        with transaction():
+            # Stato precedente per aggiornare i KPI senza ricalcolarli (il rollup lo aggiornano i trigger)
+            previous = query_one("SELECT Stato FROM Missione WHERE ID = %s FOR UPDATE", (mission_id,))
+            
+            execute(
+                "UPDATE Missione SET Stato = %s WHERE ID = %s",
+                (status, mission_id)
+            )
+        if previous:
+            dashboard.mission_status_changed(previous['Stato'], status)
+        
+        # Propaga subito il nuovo stato agli stream live
+        live.notify(mission_id)
         
         return jsonify({'message': 'Stato missione aggiornato'}), 200
     except Exception as e:
@@ -567,19 +1045,16 @@ def update_mission_status(mission_id):
 @login_required
 @role_required('admin')
 def get_stats():
-    """Statistiche per chart"""
+    """Statistiche per chart dal rollup giornaliero (?days=N oppure ?dal=&al=)"""
     try:
-        stats = query_all("""
-            SELECT 
-                DataMissione as date,
-                Stato as status,
-                COUNT(*) as count
-            FROM Missione
-            WHERE DataMissione IS NOT NULL
-            GROUP BY DataMissione, Stato
-            ORDER BY DataMissione DESC
-            LIMIT 30
-        """)
+        days = request.args.get('days', 10, type=int)
+        dal = request.args.get('dal')
+        al = request.args.get('al')
+        
+        if not (1 <= days <= 366):
+            return jsonify({'error': 'days deve essere tra 1 e 366'}), 400
+        
+        stats = rollup.daily_counts(days, dal, al)
         
         # Organizza dati per Chart.js
         dates_dict = {}
@@ -589,9 +1064,8 @@ def get_stats():
                 dates_dict[date_str] = {'in corso': 0, 'completata': 0, 'annullata': 0}
             dates_dict[date_str][stat['status']] = stat['count']
         
-        # Converti in array
-        dates = sorted(dates_dict.keys(), reverse=True)[:10]
-        dates.reverse()
+        # Date già ordinate e limitate dalla query
+        dates = sorted(dates_dict.keys())
         
         result = {
             'dates': dates,
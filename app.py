@@ -1,28 +1,84 @@
-from flask import Flask
+import time
+import click
+from flask import Flask, g, request
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
 from routes import web
 from api import api
-
-app = Flask(__name__)
-
-# Configurazione
-app.config['SECRET_KEY'] = Config.SECRET_KEY
-app.config['DEBUG'] = Config.DEBUG
-
-# CORS
-CORS(app, supports_credentials=True, origins=Config.CORS_ORIGINS)
+import assets
+import db
+import metrics
+import rollup
+from serialization import FastJSONProvider, gzip_response
 
 # Security headers
-@app.after_request
 def security_headers(response):
     response.headers['X-Content-Type-Options'] = 'nosniff'
     response.headers['X-Frame-Options'] = 'DENY'
     return response
 
-# Registra blueprints
-app.register_blueprint(web)
-app.register_blueprint(api)
+# Metriche di latenza per route (/api/admin/metrics)
+def start_timer():
+    g._started = time.perf_counter()
+
+def record_metrics(response):
+    started = g.get('_started')
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.record_request(endpoint, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+def create_app():
+    """Crea e configura l'applicazione (flask run la trova da sola; in produzione wsgi.py)"""
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+
+    # Configurazione
+    app.config['SECRET_KEY'] = Config.SECRET_KEY
+    app.config['DEBUG'] = Config.DEBUG
+
+    # IP e schema reali del client dietro TRUSTED_PROXIES proxy (limite dei tentativi di login)
+    if Config.TRUSTED_PROXIES:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXIES, x_proto=Config.TRUSTED_PROXIES)
+
+    # CORS
+    CORS(app, supports_credentials=True, origins=Config.CORS_ORIGINS)
+
+    app.after_request(security_headers)
+    # Compressione gzip delle risposte JSON/testo
+    app.after_request(gzip_response)
+    app.before_request(start_timer)
+    app.after_request(record_metrics)
+
+    # Una connessione DB per richiesta, rilasciata in teardown
+    db.init_app(app)
+
+    # Registra blueprints
+    app.register_blueprint(web)
+    app.register_blueprint(api)
+
+    # Asset statici versionati (asset_url nei template, /assets/)
+    assets.init_app(app)
+
+    # Comandi CLI
+    @app.cli.command('rollup-rebuild')
+    def rollup_rebuild():
+        """Crea tabella e trigger del rollup giornaliero delle missioni e lo ricalcola"""
+        count = rollup.rebuild()
+        click.echo(f'Rollup missioni ricostruito: {count} righe')
+
+    @app.cli.command('assets-build')
+    def assets_build():
+        """Minifica e versiona CSS/JS in static/dist con varianti .gz e .br"""
+        manifest = assets.build()
+        for source, target in manifest.items():
+            click.echo(f'{source} -> {target}')
+
+    return app
 
 if __name__ == '__main__':
+    app = create_app()
+    if Config.DB_WARMUP:
+        db.warm_up()
     app.run(host='0.0.0.0', port=5000)
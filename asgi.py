@@ -0,0 +1,278 @@
+"""Modalità di servizio ASGI:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+Le route Flask restano invariate e girano su ASGI_THREADS thread tramite WsgiToAsgi. Lo stream SSE del
+tracking (/api/missions/<id>/tracks/stream) è servito invece direttamente in asyncio su un pool
+aiomysql: uno spettatore inattivo costa una coroutine, non un thread, e un processo regge migliaia
+di connessioni aperte.
+"""
+import asyncio
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+import aiomysql
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from itsdangerous import BadSignature
+from app import create_app
+from config import Config
+import db
+import live
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = re.compile(r'^/api/missions/(\d+)/tracks/stream$')
+
+SECURITY_HEADERS = [
+    (b'x-content-type-options', b'nosniff'),
+    (b'x-frame-options', b'DENY')
+]
+
+_executor = ThreadPoolExecutor(max_workers=Config.ASGI_THREADS, thread_name_prefix='wsgi')
+
+class _ThreadedWsgiInstance(WsgiToAsgiInstance):
+    """Come WsgiToAsgiInstance (asgiref 3.8), che però esegue run_wsgi_app con thread_sensitive=True:
+    tutte le richieste Flask del processo nello stesso thread, una alla volta. Qui il corpo
+    sincrono è una copia propria e ogni richiesta gira in un thread di _executor"""
+
+    def _run_wsgi_app(self, body):
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            # Troppi header duplicati
+            self.sync_send({
+                'type': 'http.response.start',
+                'status': 400,
+                'headers': [(b'content-type', b'text/plain')]
+            })
+            self.sync_send({'type': 'http.response.body', 'body': b'Bad Request: Too many duplicate headers'})
+            return
+
+        bytes_sent = 0
+        result = self.wsgi_application(environ, self.start_response)
+        try:
+            for output in result:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                # Mai più byte di quelli dichiarati in Content-Length
+                if self.response_content_length is not None:
+                    output = output[:self.response_content_length - bytes_sent]
+                self.sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+                bytes_sent += len(output)
+                if bytes_sent == self.response_content_length:
+                    break
+        finally:
+            # Come richiede WSGI: chiude i generatori interrotti (es. db.stream rilascia la connessione)
+            if hasattr(result, 'close'):
+                result.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({'type': 'http.response.body'})
+
+    run_wsgi_app = sync_to_async(_run_wsgi_app, thread_sensitive=False, executor=_executor)
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi con le richieste eseguite in parallelo su ASGI_THREADS thread"""
+
+    async def __call__(self, scope, receive, send):
+        await _ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+# Il pool aiomysql del primario conta nella quota DB_MAX_CONNECTIONS del processo
+db.set_connection_budget(reserved=Config.ASYNC_DB_POOL_SIZE)
+app = create_app()
+flask_app = ThreadedWsgiToAsgi(app)
+
+_pool = None
+_pool_lock = None
+_loop = None
+_feeds = {}
+
+async def get_pool():
+    """Pool aiomysql del processo, creato al primo utilizzo"""
+    global _pool, _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            cfg = Config.DB_CONFIG
+            _pool = await aiomysql.create_pool(
+                host=cfg['host'], port=cfg['port'], user=cfg['user'],
+                password=cfg['password'], db=cfg['database'],
+                minsize=1, maxsize=Config.ASYNC_DB_POOL_SIZE,
+                autocommit=True, pool_recycle=Config.DB_POOL_PING_AFTER
+            )
+    return _pool
+
+class Subscriber(live.Subscriber):
+    """Spettatore con coda asyncio"""
+
+    Queue, Full = asyncio.Queue, asyncio.QueueFull
+
+class MissionFeed(live.Feed):
+    """Feed di missione aggiornato da un task asyncio (stessa logica di live.MissionFeed)"""
+
+    def __init__(self, mission_id):
+        super().__init__(mission_id)
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _poll(self):
+        query, params = self.tracks_query()
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query, params)
+                tracks = await cursor.fetchall()
+                await cursor.execute(live.STATUS_QUERY, (self.mission_id,))
+                mission = await cursor.fetchone()
+        self.update(tracks, mission)
+
+    async def _run(self):
+        first = True
+        while True:
+            if not first:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), Config.LIVE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+            first = False
+
+            if not self.subscribers:
+                self.closed = True
+                _feeds.pop(self.mission_id, None)
+                return
+
+            try:
+                await self._poll()
+            except Exception:
+                logger.exception('Errore aggiornamento feed missione %s', self.mission_id)
+                continue
+
+            if self.finished:
+                _feeds.pop(self.mission_id, None)
+                self.close()
+                return
+
+def _wake(mission_id):
+    feed = _feeds.get(mission_id)
+    if feed:
+        feed.wakeup.set()
+
+def _notify_threadsafe(mission_id):
+    """Listener di live.notify: i punti scritti dal writer di telemetria svegliano subito il feed"""
+    if _loop is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_wake, mission_id)
+
+def subscribe(mission_id):
+    subscriber = Subscriber()
+    feed = _feeds.get(mission_id)
+    if feed is None or feed.closed:
+        feed = _feeds[mission_id] = MissionFeed(mission_id)
+    feed.add(subscriber)
+    return subscriber
+
+def unsubscribe(mission_id, subscriber):
+    subscriber.closed = True
+    feed = _feeds.get(mission_id)
+    if feed:
+        feed.subscribers.discard(subscriber)
+
+def _session_user(scope):
+    """Utente della sessione Flask, letto dal cookie firmato come fa SecureCookieSessionInterface"""
+    cookie = SimpleCookie()
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookie.load(value.decode('latin-1'))
+    morsel = cookie.get(app.config['SESSION_COOKIE_NAME'])
+    serializer = app.session_interface.get_signing_serializer(app)
+    if morsel is None or serializer is None:
+        return None
+    try:
+        data = serializer.loads(morsel.value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return data.get('user')
+
+async def _json_error(send, status, message):
+    body = json.dumps({'error': message}).encode()
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        *SECURITY_HEADERS
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def stream_mission_tracks(scope, receive, send, mission_id):
+    """Stream SSE di nuovi punti e cambi di stato, come la route Flask omonima"""
+    user = _session_user(scope)
+    if not user:
+        return await _json_error(send, 401, 'Autenticazione richiesta')
+    if user.get('role') != 'customer':
+        return await _json_error(send, 403, 'Accesso negato')
+
+    subscriber = subscribe(mission_id)
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        subscriber.close()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            *SECURITY_HEADERS
+        ]})
+        while not subscriber.closed or not subscriber.queue.empty():
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), Config.LIVE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                event = ': keepalive\n\n'
+            if event is None:
+                break
+            await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        unsubscribe(mission_id, subscriber)
+
+async def _lifespan(receive, send):
+    global _loop
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            _loop = asyncio.get_running_loop()
+            if Config.DB_WARMUP:
+                try:
+                    await asyncio.gather(asyncio.to_thread(db.warm_up), get_pool())
+                except Exception:
+                    logger.exception('Warm-up dei pool DB non riuscito')
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _pool is not None:
+                _pool.close()
+                await _pool.wait_closed()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    """Applicazione ASGI: stream del tracking in asyncio, tutto il resto a Flask"""
+    global _loop
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        match = STREAM_PATH.match(scope['path'])
+        if match:
+            _loop = _loop or asyncio.get_running_loop()
+            return await stream_mission_tracks(scope, receive, send, int(match.group(1)))
+    return await flask_app(scope, receive, send)
+
+live.add_listener(_notify_threadsafe)
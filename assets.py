@@ -0,0 +1,148 @@
+"""Asset statici versionati:
+
+    flask assets-build
+
+minifica CSS/JS di static/, li scrive in static/dist con l'hash del contenuto nel nome
+(js/app_admin.3f2a9c1b0d4e.js) insieme alle varianti .gz e .br e a manifest.json. Nei template
+asset_url('js/app_admin.js') punta al file versionato, servito da /assets/ con cache immutabile
+di un anno; senza build (sviluppo) ricade sul file originale in /static/.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from flask import Blueprint, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # solo varianti .gz
+    brotli = None
+
+try:
+    import rjsmin
+    import rcssmin
+except ImportError:  # minificazione conservativa interna
+    rjsmin = rcssmin = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+SOURCES = ('css', 'js')
+MAX_AGE = 365 * 24 * 3600
+
+# Varianti precompresse in ordine di preferenza: codifica -> estensione
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+assets = Blueprint('assets', __name__)
+
+_manifest = None
+_manifest_mtime = None
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACES = re.compile(r'\s*([{};,])\s*')
+
+def minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    text = _CSS_COMMENT.sub('', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = _CSS_SPACES.sub(r'\1', text)
+    return text.replace(';}', '}').strip() + '\n'
+
+def minify_js(text):
+    """Senza rjsmin: rimuove indentazione, righe vuote e commenti a riga intera, lasciando
+    gli a capo (nessun rischio con l'inserimento automatico dei punti e virgola)"""
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    lines = []
+    in_template = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not in_template and (not stripped or stripped.startswith('//')):
+            continue
+        lines.append(stripped)
+        # Dentro un template literal su più righe i commenti sono testo
+        if line.replace('\\`', '').count('`') % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def build():
+    """Genera static/dist e il manifest; ritorna {sorgente: file versionato}"""
+    manifest = {}
+    for folder in SOURCES:
+        for name in sorted(os.listdir(os.path.join(STATIC_DIR, folder))):
+            base, ext = os.path.splitext(name)
+            if ext not in MINIFIERS:
+                continue
+            source = f'{folder}/{name}'
+            with open(os.path.join(STATIC_DIR, source), encoding='utf-8') as f:
+                data = MINIFIERS[ext](f.read()).encode('utf-8')
+
+            target = f'{folder}/{base}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+            path = os.path.join(DIST_DIR, target)
+            _write(path, data)
+            # mtime=0: stesso contenuto, stesso .gz a ogni build
+            _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write(path + '.br', brotli.compress(data, quality=11))
+            manifest[source] = target
+
+    _write(MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+def _load_manifest():
+    """Manifest della build, riletto quando il file cambia (es. nuova build col server avviato)"""
+    global _manifest, _manifest_mtime
+    try:
+        mtime = os.stat(MANIFEST).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if mtime != _manifest_mtime:
+        with open(MANIFEST, encoding='utf-8') as f:
+            _manifest = json.load(f)
+        _manifest_mtime = mtime
+    return _manifest
+
+def build_id():
+    """Identificativo della build corrente (None senza build): cambia a ogni flask assets-build"""
+    return _manifest_mtime if _load_manifest() else None
+
+def asset_url(path):
+    """URL versionato dell'asset se presente nella build, altrimenti il file in /static/"""
+    target = _load_manifest().get(path)
+    if target is None:
+        return url_for('static', filename=path)
+    return url_for('assets.serve', filename=target)
+
+@assets.route('/assets/<path:filename>')
+def serve(filename):
+    """File versionato, nella variante precompressa accettata dal client"""
+    mimetype = mimetypes.guess_type(filename)[0]
+    accepted = request.accept_encodings
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if name in accepted and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            encoding = name
+            filename += suffix
+            break
+
+    response = send_from_directory(DIST_DIR, filename, mimetype=mimetype, max_age=MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Il nome cambia con il contenuto: il browser non deve mai riconvalidare
+    response.headers['Cache-Control'] = f'public, max-age={MAX_AGE}, immutable'
+    return response
+
+def init_app(app):
+    app.register_blueprint(assets)
+    app.add_template_global(asset_url)
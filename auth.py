@@ -1,5 +1,9 @@
+import hmac
+import threading
+import time
 from functools import wraps
-from flask import session, jsonify, redirect, url_for
+from flask import request, session, jsonify, redirect, url_for
+from config import Config
 
 def login_required(f):
     """Decoratore per richiedere autenticazione"""
@@ -23,6 +27,18 @@ def role_required(role):
         return decorated
     return decorator
 
+def telemetry_auth_required(f):
+    """Decoratore per l'ingestione telemetria: chiave X-Telemetry-Key o sessione admin"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get('X-Telemetry-Key')
+        if key and Config.TELEMETRY_KEY and hmac.compare_digest(key, Config.TELEMETRY_KEY):
+            return f(*args, **kwargs)
+        if session.get('user', {}).get('role') == 'admin':
+            return f(*args, **kwargs)
+        return jsonify({'error': 'Autenticazione richiesta'}), 401
+    return decorated
+
 def login_user(user_data):
     """Salva l'utente nella sessione"""
     session['user'] = {
@@ -39,3 +55,54 @@ def logout_user():
 def current_user():
     """Ritorna l'utente corrente dalla sessione"""
     return session.get('user')
+
+class LoginThrottled(Exception):
+    """Troppi tentativi di accesso dallo stesso IP o per la stessa email"""
+
+    def __init__(self, retry_after):
+        super().__init__('Troppi tentativi, riprovare più tardi')
+        self.retry_after = retry_after
+
+# Tentativi falliti per chiave ('ip:...' o 'mail:...'): [inizio finestra, conteggio]
+_attempts = {}
+_attempts_lock = threading.Lock()
+
+def _wait(key, limit, now):
+    """Secondi di attesa se la chiave ha già raggiunto il limite nella finestra corrente, altrimenti 0"""
+    entry = _attempts.get(key)
+    if entry is None or now - entry[0] >= Config.LOGIN_ATTEMPT_WINDOW or entry[1] < limit:
+        return 0
+    return entry[0] + Config.LOGIN_ATTEMPT_WINDOW - now
+
+def _count(key, now):
+    """Conta un tentativo fallito, aprendo una nuova finestra se la precedente è scaduta"""
+    entry = _attempts.get(key)
+    if entry is None or now - entry[0] >= Config.LOGIN_ATTEMPT_WINDOW:
+        entry = _attempts[key] = [now, 0]
+    entry[1] += 1
+
+def check_login_attempt(ip, email=None):
+    """Blocca login/registrazione (LoginThrottled) se l'IP o l'email hanno troppi tentativi falliti"""
+    now = time.monotonic()
+    with _attempts_lock:
+        wait = _wait(f'ip:{ip}', Config.LOGIN_ATTEMPTS_PER_IP, now)
+        if not wait and email:
+            wait = _wait(f'mail:{email.lower()}', Config.LOGIN_ATTEMPTS_PER_EMAIL, now)
+    if wait:
+        raise LoginThrottled(max(1, int(wait + 0.999)))
+
+def login_failed(ip, email=None):
+    """Conta un tentativo fallito per l'IP e, se indicata, per l'email"""
+    now = time.monotonic()
+    with _attempts_lock:
+        if len(_attempts) > 10000:
+            for key in [k for k, v in _attempts.items() if now - v[0] >= Config.LOGIN_ATTEMPT_WINDOW]:
+                del _attempts[key]
+        _count(f'ip:{ip}', now)
+        if email:
+            _count(f'mail:{email.lower()}', now)
+
+def login_succeeded(email):
+    """Azzera i tentativi per l'email dopo un accesso riuscito"""
+    with _attempts_lock:
+        _attempts.pop(f'mail:{email.lower()}', None)
@@ -0,0 +1,430 @@
+"""Benchmark riproducibile delle API su un database MySQL locale popolato con dati sintetici.
+
+    python bench.py seed --missions 20000 --points 100
+    python bench.py run --concurrency 8 --requests 500 --output bench.json
+    python bench.py compare prima.json dopo.json
+
+Si collega a un server dedicato (BENCH_DB_HOST, BENCH_DB_PORT, BENCH_DB_USER, BENCH_DB_PASSWORD;
+default root@localhost:3306) e al database BENCH_DB_NAME (default droni_bench), che `seed` ricrea da
+zero; si rifiuta di partire se il server coincide con il primario o una replica dell'app. Il report
+riporta per scenario latenze p50/p95/p99, throughput e query DB per richiesta (dalle metriche dell'app).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+import mysql.connector
+from werkzeug.security import generate_password_hash
+from config import Config
+
+BENCH_DB = os.getenv('BENCH_DB_NAME', 'droni_bench')
+# Server del benchmark: mai quello dell'app, `seed` esegue DROP DATABASE
+BENCH_DB_CONFIG = {
+    'host': os.getenv('BENCH_DB_HOST', 'localhost'),
+    'port': int(os.getenv('BENCH_DB_PORT', '3306')),
+    'user': os.getenv('BENCH_DB_USER', 'root'),
+    'password': os.getenv('BENCH_DB_PASSWORD', ''),
+    'database': BENCH_DB
+}
+BENCH_PASSWORD = 'bench123'
+
+# Centro delle consegne sintetiche (Milano)
+CENTER = (45.4642, 9.19)
+
+SCHEMA = [
+    """CREATE TABLE Utente (
+        ID INT AUTO_INCREMENT PRIMARY KEY,
+        Nome VARCHAR(100) NOT NULL,
+        Mail VARCHAR(255) NOT NULL UNIQUE,
+        Password VARCHAR(255) NOT NULL,
+        Ruolo VARCHAR(20) NOT NULL
+    )""",
+    """CREATE TABLE Drone (
+        ID INT AUTO_INCREMENT PRIMARY KEY,
+        Modello VARCHAR(100) NOT NULL,
+        Batteria INT NOT NULL,
+        Capacita DECIMAL(6,2) NOT NULL
+    )""",
+    """CREATE TABLE Pilota (
+        ID INT AUTO_INCREMENT PRIMARY KEY,
+        Nome VARCHAR(100) NOT NULL,
+        Cognome VARCHAR(100) NOT NULL,
+        Turno VARCHAR(20) NOT NULL,
+        Brevetto VARCHAR(50) NOT NULL
+    )""",
+    """CREATE TABLE Missione (
+        ID INT AUTO_INCREMENT PRIMARY KEY,
+        DataMissione DATE NOT NULL,
+        Ora TIME NOT NULL,
+        Stato VARCHAR(20) NOT NULL,
+        IdDrone INT,
+        IdPilota INT,
+        Valutazione INT,
+        Commento TEXT,
+        KEY idx_missione_data (DataMissione, Ora, ID)
+    )""",
+    """CREATE TABLE Ordine (
+        ID INT AUTO_INCREMENT PRIMARY KEY,
+        Tipo VARCHAR(50) NOT NULL,
+        PesoTotale DECIMAL(8,2) NOT NULL,
+        Orario DATETIME NOT NULL,
+        IndirizzoDestinazione VARCHAR(255) NOT NULL,
+        ID_Utente INT NOT NULL,
+        ID_Missione INT,
+        KEY idx_ordine_utente (ID_Utente, Orario, ID)
+    )""",
+    """CREATE TABLE Prodotto (
+        ID INT AUTO_INCREMENT PRIMARY KEY,
+        nome VARCHAR(100) NOT NULL,
+        categoria VARCHAR(50) NOT NULL,
+        peso DECIMAL(8,2) NOT NULL
+    )""",
+    """CREATE TABLE Contiene (
+        ID_Ordine INT NOT NULL,
+        ID_Prodotto INT NOT NULL,
+        Quantita INT NOT NULL,
+        PRIMARY KEY (ID_Ordine, ID_Prodotto)
+    )""",
+    """CREATE TABLE Traccia (
+        ID_Drone INT NOT NULL,
+        ID_Missione INT NOT NULL,
+        Latitudine DECIMAL(9,6) NOT NULL,
+        Longitudine DECIMAL(9,6) NOT NULL,
+        TIMESTAMP DATETIME NOT NULL,
+        KEY idx_traccia_missione (ID_Missione, TIMESTAMP)
+    )"""
+]
+
+STATES = ['completata'] * 7 + ['annullata'] * 2 + ['in corso']
+CHUNK = 5000
+
+def _address(host, port):
+    """(IP, porta) di un host, per confrontare nomi diversi dello stesso server"""
+    try:
+        host = socket.gethostbyname(host)
+    except (OSError, TypeError):
+        pass
+    return str(host).lower(), int(port)
+
+def _check_target():
+    """Esce se il server del benchmark è il primario o una replica configurati per l'app"""
+    app_servers = [(Config.DB_CONFIG['host'], Config.DB_CONFIG['port'])]
+    for replica in Config.DB_REPLICAS:
+        host, _, port = replica.partition(':')
+        app_servers.append((host, port or Config.DB_CONFIG['port']))
+    target = _address(BENCH_DB_CONFIG['host'], BENCH_DB_CONFIG['port'])
+    for host, port in app_servers:
+        if host and _address(host, port) == target:
+            sys.exit(f'BENCH_DB_HOST ({BENCH_DB_CONFIG["host"]}) coincide con il database '
+                     f'dell\'app ({host}:{port}): configurare un server dedicato al benchmark')
+
+def _use_bench_db():
+    """Punta l'app al server del benchmark: letture e scritture lì, senza repliche"""
+    Config.DB_CONFIG = dict(BENCH_DB_CONFIG)
+    Config.DB_REPLICAS = []
+
+def _connect(database=None):
+    cfg = dict(BENCH_DB_CONFIG)
+    cfg['database'] = database
+    return mysql.connector.connect(**cfg)
+
+def _insert(conn, query, rows):
+    """INSERT multi-riga a blocchi di CHUNK righe"""
+    cursor = conn.cursor()
+    for i in range(0, len(rows), CHUNK):
+        cursor.executemany(query, rows[i:i + CHUNK])
+    conn.commit()
+    cursor.close()
+
+def _track(rng, mission_id, drone_id, start, points):
+    """Punti di un volo rettilineo con rumore dal centro a una destinazione casuale"""
+    angle = rng.uniform(0, 2 * math.pi)
+    dist = rng.uniform(0.01, 0.08)
+    lat2, lng2 = CENTER[0] + dist * math.sin(angle), CENTER[1] + dist * math.cos(angle)
+    for i in range(points):
+        f = i / max(points - 1, 1)
+        yield (
+            drone_id, mission_id,
+            round(CENTER[0] + (lat2 - CENTER[0]) * f + rng.gauss(0, 0.0001), 6),
+            round(CENTER[1] + (lng2 - CENTER[1]) * f + rng.gauss(0, 0.0001), 6),
+            start + timedelta(seconds=5 * i)
+        )
+
+def seed(args):
+    """Ricrea il database di benchmark con una flotta sintetica deterministica"""
+    _check_target()
+    rng = random.Random(args.seed)
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{BENCH_DB}`")
+    cursor.execute(f"CREATE DATABASE `{BENCH_DB}`")
+    cursor.execute(f"USE `{BENCH_DB}`")
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    cursor.close()
+
+    # Stessa password per tutti: l'hash è costoso e serve una volta sola
+    password = generate_password_hash(BENCH_PASSWORD)
+    users = [('Admin', 'admin@bench.local', password, 'admin')]
+    users += [(f'Cliente {i}', f'cliente{i}@bench.local', password, 'cliente') for i in range(1, args.users + 1)]
+    _insert(conn, "INSERT INTO Utente (Nome, Mail, Password, Ruolo) VALUES (%s, %s, %s, %s)", users)
+
+    _insert(conn, "INSERT INTO Drone (Modello, Batteria, Capacita) VALUES (%s, %s, %s)", [
+        (f'DX-{i % 7}', rng.randint(40, 100), rng.choice([2.5, 5, 10])) for i in range(args.drones)
+    ])
+    _insert(conn, "INSERT INTO Pilota (Nome, Cognome, Turno, Brevetto) VALUES (%s, %s, %s, %s)", [
+        (f'Pilota{i}', f'Cognome{i}', rng.choice(['mattina', 'pomeriggio', 'notte']), f'BR-{i:05d}')
+        for i in range(args.pilots)
+    ])
+    _insert(conn, "INSERT INTO Prodotto (nome, categoria, peso) VALUES (%s, %s, %s)", [
+        (f'Prodotto {i}', rng.choice(['farmaci', 'alimentari', 'ricambi']), round(rng.uniform(0.1, 3), 2))
+        for i in range(args.products)
+    ])
+
+    first_day = date.today() - timedelta(days=args.days)
+    missions, starts = [], []
+    for i in range(args.missions):
+        start = datetime.combine(first_day + timedelta(days=rng.randrange(args.days)), datetime.min.time())
+        start += timedelta(minutes=rng.randrange(6 * 60, 22 * 60))
+        state = rng.choice(STATES)
+        rating = rng.randint(1, 10) if state == 'completata' and rng.random() < 0.5 else None
+        missions.append((start.date(), start.time(), state, rng.randint(1, args.drones), rng.randint(1, args.pilots), rating))
+        starts.append(start)
+    _insert(conn, """
+        INSERT INTO Missione (DataMissione, Ora, Stato, IdDrone, IdPilota, Valutazione)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, missions)
+
+    orders, contents = [], []
+    for i, start in enumerate(starts, 1):
+        orders.append((rng.choice(['standard', 'urgente']), round(rng.uniform(0.5, 5), 2), start,
+                       f'Via Sintetica {rng.randint(1, 200)}, Milano', rng.randint(2, args.users + 1), i))
+        for product_id in rng.sample(range(1, args.products + 1), rng.randint(1, 3)):
+            contents.append((i, product_id, rng.randint(1, 4)))
+    _insert(conn, """
+        INSERT INTO Ordine (Tipo, PesoTotale, Orario, IndirizzoDestinazione, ID_Utente, ID_Missione)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, orders)
+    _insert(conn, "INSERT INTO Contiene (ID_Ordine, ID_Prodotto, Quantita) VALUES (%s, %s, %s)", contents)
+
+    # Milioni di punti: generati e scritti a blocchi per non tenerli tutti in memoria
+    batch, total = [], 0
+    for mission_id, (start, mission) in enumerate(zip(starts, missions), 1):
+        batch.extend(_track(rng, mission_id, mission[3], start, args.points))
+        if len(batch) >= CHUNK * 10:
+            _insert(conn, "INSERT INTO Traccia (ID_Drone, ID_Missione, Latitudine, Longitudine, TIMESTAMP) VALUES (%s, %s, %s, %s, %s)", batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        _insert(conn, "INSERT INTO Traccia (ID_Drone, ID_Missione, Latitudine, Longitudine, TIMESTAMP) VALUES (%s, %s, %s, %s, %s)", batch)
+        total += len(batch)
+    conn.close()
+
+    # Il rollup delle statistiche vive nello stesso database
+    _use_bench_db()
+    import rollup
+    rollup.rebuild()
+
+    print(json.dumps({
+        'database': BENCH_DB, 'users': args.users, 'drones': args.drones, 'pilots': args.pilots,
+        'missions': args.missions, 'orders': len(orders), 'tracks': total
+    }))
+
+# Scenari: nome -> (ruolo della sessione, generatore della richiesta)
+SCENARIOS = {
+    'login': (None, lambda rng, a: ('POST', '/api/auth/login', {
+        'email': f'cliente{rng.randint(1, a.users)}@bench.local', 'password': BENCH_PASSWORD
+    })),
+    'tracks': ('customer', lambda rng, a: ('GET', f'/api/missions/{rng.randint(1, a.missions)}/tracks', None)),
+    'tracks_zoom': ('customer', lambda rng, a: (
+        'GET', f'/api/missions/{rng.randint(1, a.missions)}/tracks?zoom=15&format=polyline', None
+    )),
+    'admin_missions': ('admin', lambda rng, a: ('GET', '/api/admin/missions', None)),
+    'admin_missions_filtered': ('admin', lambda rng, a: (
+        'GET', f'/api/admin/missions?stato=completata&drone_id={rng.randint(1, a.drones)}', None
+    )),
+    'admin_dashboard': ('admin', lambda rng, a: ('GET', '/api/admin/dashboard', None))
+}
+
+def _percentile(values, p):
+    """Percentile nearest-rank su una lista ordinata"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+def _client(app, role):
+    client = app.test_client()
+    email = 'admin@bench.local' if role == 'admin' else 'cliente1@bench.local'
+    if role:
+        response = client.post('/api/auth/login', json={'email': email, 'password': BENCH_PASSWORD})
+        if response.status_code != 200:
+            raise RuntimeError(f'Login {role} fallito: {response.get_data(as_text=True)}')
+    return client
+
+def _run_scenario(app, name, args):
+    import metrics
+    role, make_request = SCENARIOS[name]
+    clients = [_client(app, role) for _ in range(args.concurrency)]
+    metrics.reset()
+
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    remaining = [args.requests]
+
+    def worker(index):
+        rng = random.Random(f'{args.seed}-{name}-{index}')
+        client = clients[index]
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            method, path, body = make_request(rng, args)
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            response.get_data()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    routes = metrics.snapshot()
+    served = sum(r['requests'] for r in routes.values())
+    queries = sum(r['queries'] for r in routes.values())
+    return {
+        'requests': len(latencies),
+        'concurrency': args.concurrency,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(latencies) / duration, 1) if duration else None,
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 50) * 1000, 2),
+            'p95': round(_percentile(latencies, 95) * 1000, 2),
+            'p99': round(_percentile(latencies, 99) * 1000, 2),
+            'mean': round(sum(latencies) / len(latencies) * 1000, 2),
+            'max': round(latencies[-1] * 1000, 2)
+        },
+        'db_queries_per_request': round(queries / served, 2) if served else 0,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())}
+    }
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    """Esegue gli scenari in sequenza, ciascuno a concorrenza fissa, e scrive i risultati in JSON"""
+    _check_target()
+    _use_bench_db()
+    # Il benchmark ripete molti login dallo stesso IP: nessun limite di tentativi
+    Config.LOGIN_ATTEMPTS_PER_IP = Config.LOGIN_ATTEMPTS_PER_EMAIL = sys.maxsize
+    from app import create_app
+    app = create_app()
+    from db import query_one
+
+    # Dimensioni della flotta lette dal database, così le richieste puntano a righe esistenti
+    sizes = query_one("""
+        SELECT
+            (SELECT COUNT(*) FROM Utente WHERE Ruolo = 'cliente') as users,
+            (SELECT COUNT(*) FROM Drone) as drones,
+            (SELECT COUNT(*) FROM Missione) as missions,
+            (SELECT COUNT(*) FROM Traccia) as tracks
+    """)
+    for key in ('users', 'drones', 'missions'):
+        setattr(args, key, int(sizes[key]))
+
+    names = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        sys.exit(f'Scenari sconosciuti: {", ".join(unknown)}')
+
+    # Riscaldamento: pool e cache come in un worker già avviato
+    if args.warmup:
+        warm = argparse.Namespace(**{**vars(args), 'requests': args.warmup})
+        for name in names:
+            _run_scenario(app, name, warm)
+
+    report = {
+        'commit': _commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'settings': {k: v for k, v in vars(args).items() if k not in ('func', 'output')},
+        'dataset': {k: int(v) for k, v in sizes.items()},
+        'results': {name: _run_scenario(app, name, args) for name in names}
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+def compare(args):
+    """Variazione percentuale di p50/p95/p99 e throughput tra due report"""
+    with open(args.before) as f:
+        before = json.load(f)['results']
+    with open(args.after) as f:
+        after = json.load(f)['results']
+
+    def delta(old, new):
+        return f'{(new - old) / old * 100:+.1f}%' if old else 'n/d'
+
+    print(f'{"scenario":<26}{"p50":>10}{"p95":>10}{"p99":>10}{"rps":>10}{"query/req":>12}')
+    for name in sorted(set(before) & set(after)):
+        old, new = before[name], after[name]
+        print(f'{name:<26}'
+              f'{delta(old["latency_ms"]["p50"], new["latency_ms"]["p50"]):>10}'
+              f'{delta(old["latency_ms"]["p95"], new["latency_ms"]["p95"]):>10}'
+              f'{delta(old["latency_ms"]["p99"], new["latency_ms"]["p99"]):>10}'
+              f'{delta(old["throughput_rps"], new["throughput_rps"]):>10}'
+              f'{old["db_queries_per_request"]:>6} → {new["db_queries_per_request"]:<4}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seed', type=int, default=42, help='seme dei dati e delle richieste')
+    commands = parser.add_subparsers(required=True)
+
+    p = commands.add_parser('seed', help='ricrea e popola il database di benchmark')
+    p.add_argument('--users', type=int, default=1000)
+    p.add_argument('--drones', type=int, default=50)
+    p.add_argument('--pilots', type=int, default=30)
+    p.add_argument('--missions', type=int, default=20000)
+    p.add_argument('--products', type=int, default=200)
+    p.add_argument('--points', type=int, default=100, help='punti GPS per missione')
+    p.add_argument('--days', type=int, default=365, help='giorni coperti dalle missioni')
+    p.set_defaults(func=seed)
+
+    p = commands.add_parser('run', help='misura gli endpoint')
+    p.add_argument('--concurrency', type=int, default=8)
+    p.add_argument('--requests', type=int, default=500, help='richieste per scenario')
+    p.add_argument('--warmup', type=int, default=20, help='richieste di riscaldamento per scenario')
+    p.add_argument('--scenarios', help=f'elenco separato da virgole (default: {",".join(SCENARIOS)})')
+    p.add_argument('--output', help='file JSON dei risultati')
+    p.set_defaults(func=run)
+
+    p = commands.add_parser('compare', help='confronta due report')
+    p.add_argument('before')
+    p.add_argument('after')
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
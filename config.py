@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -28,4 +29,104 @@ class Config:
         'database': database
     }
     
+    # Pool connessioni: `DB_POOL_SIZE` stabili più `DB_POOL_MAX_OVERFLOW` temporanee;
+    # a pool esaurito si attende fino a DB_POOL_TIMEOUT secondi (max DB_POOL_MAX_WAITERS in coda)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW', '5'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+    DB_POOL_MAX_WAITERS = int(os.getenv('DB_POOL_MAX_WAITERS', '50'))
+    # Secondi di inattività oltre i quali una connessione viene verificata con un ping prima dell'uso
+    DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', '30'))
+    # Apertura delle DB_POOL_SIZE connessioni all'avvio di ogni worker invece che alla prima richiesta
+    DB_WARMUP = os.getenv('DB_WARMUP', '0') == '1'
+    # Connessioni massime per server MySQL di tutti i processi insieme (0 = nessun limite): sotto
+    # gunicorn ogni worker usa al più DB_MAX_CONNECTIONS // WEB_WORKERS connessioni, in modalità
+    # ASGI il pool aiomysql (ASYNC_DB_POOL_SIZE) è sottratto dalla quota del primario
+    DB_MAX_CONNECTIONS = int(os.getenv('DB_MAX_CONNECTIONS', '0'))
+
+    # Repliche di sola lettura (host[:porta] separati da virgole, stesse credenziali del primario).
+    # Dopo una scrittura la sessione legge dal primario per DB_REPLICA_PIN_SECONDS;
+    # una replica in errore resta esclusa per DB_REPLICA_RETRY secondi
+    DB_REPLICAS = [r.strip() for r in os.getenv('DB_REPLICAS', '').split(',') if r.strip()]
+    DB_REPLICA_PIN_SECONDS = float(os.getenv('DB_REPLICA_PIN_SECONDS', '5'))
+    DB_REPLICA_RETRY = float(os.getenv('DB_REPLICA_RETRY', '30'))
+
+    # Statement preparati lato server per le SELECT, in cache per connessione (LRU). Disattivati
+    # di default: ogni riesecuzione costa un round trip in più (COM_STMT_RESET prima di
+    # COM_STMT_EXECUTE), che per query brevi supera il parsing risparmiato; attivarli solo se
+    # `python bench.py` mostra un guadagno sul proprio carico
+    DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', '0') == '1'
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '64'))
+
+    # Query più lente di questa soglia (millisecondi) finiscono nel log; 0 disattiva
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+
+    # Server di produzione (gunicorn.conf.py): processi worker e thread per worker
+    WEB_BIND = os.getenv('WEB_BIND', '0.0.0.0:5000')
+    WEB_WORKERS = int(os.getenv('WEB_WORKERS', str(os.cpu_count() or 1)))
+    WEB_THREADS = int(os.getenv('WEB_THREADS', '4'))
+    WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', '30'))
+
+    # Hashing password in un pool di processi: HASH_WORKERS processi (0 = in linea) e al più
+    # HASH_QUEUE_SIZE calcoli in coda, oltre si risponde 503. Gli hash con metodo diverso da
+    # PASSWORD_HASH_METHOD vengono rigenerati al login
+    HASH_WORKERS = int(os.getenv('HASH_WORKERS', str(min(2, os.cpu_count() or 1))))
+    HASH_QUEUE_SIZE = int(os.getenv('HASH_QUEUE_SIZE', '16'))
+    HASH_TIMEOUT = float(os.getenv('HASH_TIMEOUT', '5'))
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+
+    # Tentativi di login/registrazione per finestra di LOGIN_ATTEMPT_WINDOW secondi
+    LOGIN_ATTEMPTS_PER_IP = int(os.getenv('LOGIN_ATTEMPTS_PER_IP', '30'))
+    LOGIN_ATTEMPTS_PER_EMAIL = int(os.getenv('LOGIN_ATTEMPTS_PER_EMAIL', '5'))
+    LOGIN_ATTEMPT_WINDOW = float(os.getenv('LOGIN_ATTEMPT_WINDOW', '60'))
+
     CORS_ORIGINS = ['http://localhost:5000', 'http://127.0.0.1:5000']
+
+    # Proxy (load balancer, nginx) davanti all'app: l'IP del client è letto da X-Forwarded-For solo
+    # per questi livelli; 0 ignora l'header, che altrimenti il client potrebbe falsificare
+    TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+
+    # Tracking live (Server-Sent Events). Con LIVE_SSE=0 lo stream risponde 503 e il client passa
+    # al polling: sotto gunicorn (gthread) ogni spettatore terrebbe occupato un thread del worker
+    LIVE_SSE = os.getenv('LIVE_SSE', '1') == '1'
+    LIVE_POLL_INTERVAL = float(os.getenv('LIVE_POLL_INTERVAL', '1'))
+    LIVE_KEEPALIVE = float(os.getenv('LIVE_KEEPALIVE', '15'))
+    LIVE_QUEUE_SIZE = int(os.getenv('LIVE_QUEUE_SIZE', '100'))
+    # I punti sono filtrati sul TIMESTAMP del drone, che non segue l'ordine di scrittura (buffer dei
+    # writer, più worker): le letture incrementali rileggono TRACK_LATE_WINDOW secondi prima del cursore
+    TRACK_LATE_WINDOW = int(os.getenv('TRACK_LATE_WINDOW', '10'))
+    # Connessioni aiomysql per gli stream serviti in modalità ASGI (asgi.py)
+    ASYNC_DB_POOL_SIZE = int(os.getenv('ASYNC_DB_POOL_SIZE', '10'))
+    # Thread che eseguono in parallelo le route Flask in modalità ASGI
+    ASGI_THREADS = int(os.getenv('ASGI_THREADS', '16'))
+
+    # Semplificazione tracce GPS
+    TRACK_SIMPLIFY_PIXELS = float(os.getenv('TRACK_SIMPLIFY_PIXELS', '1'))
+    TRACK_CACHE_SIZE = int(os.getenv('TRACK_CACHE_SIZE', '256'))
+
+    # Ingestione telemetria (/api/telemetry)
+    TELEMETRY_KEY = os.getenv('TELEMETRY_KEY')
+    TELEMETRY_MAX_BATCH = int(os.getenv('TELEMETRY_MAX_BATCH', '1000'))
+    TELEMETRY_QUEUE_SIZE = int(os.getenv('TELEMETRY_QUEUE_SIZE', '20000'))
+    TELEMETRY_BATCH_SIZE = int(os.getenv('TELEMETRY_BATCH_SIZE', '500'))
+    TELEMETRY_FLUSH_INTERVAL = float(os.getenv('TELEMETRY_FLUSH_INTERVAL', '0.5'))
+    TELEMETRY_SUBMIT_TIMEOUT = float(os.getenv('TELEMETRY_SUBMIT_TIMEOUT', '1'))
+    # Scrittura di un blocco fallita per un errore transitorio: TELEMETRY_RETRIES nuovi tentativi, con attesa iniziale di
+    # TELEMETRY_RETRY_DELAY secondi raddoppiata a ogni tentativo, prima di scartarlo
+    TELEMETRY_RETRIES = int(os.getenv('TELEMETRY_RETRIES', '3'))
+    TELEMETRY_RETRY_DELAY = float(os.getenv('TELEMETRY_RETRY_DELAY', '0.5'))
+
+    # Cache KPI dashboard admin (secondi); le scritture dell'app la invalidano subito in tutti i
+    # processi, il TTL copre quelle fatte fuori dall'app
+    DASHBOARD_TTL = float(os.getenv('DASHBOARD_TTL', '30'))
+
+    # File di versione delle liste droni/piloti e dei KPI: la directory va condivisa da tutti i processi dell'app
+    CACHE_VERSION_DIR = os.getenv('CACHE_VERSION_DIR', os.path.join(tempfile.gettempdir(), 'droni_cache'))
+
+    # Paginazione keyset delle liste
+    PAGE_SIZE = int(os.getenv('PAGE_SIZE', '50'))
+    PAGE_SIZE_MAX = int(os.getenv('PAGE_SIZE_MAX', '200'))
+
+    # Compressione gzip delle risposte (byte minimi e livello 1-9)
+    GZIP_MIN_SIZE = int(os.getenv('GZIP_MIN_SIZE', '1024'))
+    GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '5'))
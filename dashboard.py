@@ -0,0 +1,119 @@
+import threading
+import time
+from config import Config
+from db import query_one
+import refcache
+
+# Stato -> chiave del contatore
+STATUS_KEYS = {
+    'in corso': 'in_progress',
+    'completata': 'completed',
+    'annullata': 'cancelled'
+}
+
+# Tutti i KPI in un solo round trip; somme e conteggi permettono aggiornamenti incrementali esatti
+KPI_QUERY = """
+    SELECT
+        COALESCE(SUM(Stato = 'in corso'), 0) as in_progress,
+        COALESCE(SUM(Stato = 'completata'), 0) as completed,
+        COALESCE(SUM(Stato = 'annullata'), 0) as cancelled,
+        COALESCE(SUM(Valutazione), 0) as rating_sum,
+        COUNT(Valutazione) as rating_count,
+        (SELECT COALESCE(SUM(PesoTotale), 0) FROM Ordine) as weight_sum,
+        (SELECT COUNT(PesoTotale) FROM Ordine) as weight_count
+    FROM Missione
+"""
+
+# Versione condivisa (file in CACHE_VERSION_DIR) cambiata da ogni scrittura che tocca i KPI:
+# gli altri processi ricaricano i totali alla richiesta successiva invece che alla scadenza del TTL
+VERSION = 'dashboard'
+
+_lock = threading.Lock()
+_totals = None
+_version = None
+_loaded_at = 0.0
+# Incrementato a ogni variazione: un ricaricamento iniziato prima non viene messo in cache
+_generation = 0
+
+def _load():
+    row = query_one(KPI_QUERY)
+    return {
+        'in_progress': int(row['in_progress']),
+        'completed': int(row['completed']),
+        'cancelled': int(row['cancelled']),
+        'rating_sum': float(row['rating_sum']),
+        'rating_count': int(row['rating_count']),
+        'weight_sum': float(row['weight_sum']),
+        'weight_count': int(row['weight_count'])
+    }
+
+def _average(total, count):
+    return round(total / count, 2) if count else 0
+
+def get_kpis():
+    """KPI della dashboard admin, ricalcolati alla scadenza del TTL o dopo una scrittura di un altro processo"""
+    global _totals, _version, _loaded_at
+    current = refcache.version(VERSION)
+    with _lock:
+        fresh = _version == current and time.monotonic() - _loaded_at < Config.DASHBOARD_TTL
+        totals = dict(_totals) if _totals is not None and fresh else None
+        generation = _generation
+    if totals is None:
+        totals = _load()
+        with _lock:
+            # Una variazione arrivata durante la lettura potrebbe mancare dai totali letti
+            if _generation == generation:
+                _totals, _version, _loaded_at = dict(totals), current, time.monotonic()
+    return {
+        'missions_in_progress': totals['in_progress'],
+        'missions_completed': totals['completed'],
+        'missions_cancelled': totals['cancelled'],
+        'avg_order_weight': _average(totals['weight_sum'], totals['weight_count']),
+        'avg_rating': _average(totals['rating_sum'], totals['rating_count'])
+    }
+
+def _changed(apply):
+    """Registra una scrittura già confermata: la applica ai totali in cache solo se questi erano
+    allineati alla versione condivisa, poi pubblica una nuova versione per gli altri processi.
+    Una scrittura di un altro processo tra la lettura della versione e bump() resta esclusa dai
+    totali di questo processo al più per DASHBOARD_TTL"""
+    global _totals, _version, _generation
+    with _lock:
+        _generation += 1
+        current = refcache.version(VERSION)
+        aligned = _totals is not None and _version == current
+        _version = refcache.bump(VERSION)
+        if aligned:
+            apply(_totals)
+        else:
+            _totals = None
+
+def mission_status_changed(old_status, new_status):
+    """Aggiorna i contatori in cache dopo un cambio di stato"""
+    if old_status == new_status:
+        return
+
+    def apply(totals):
+        if old_status in STATUS_KEYS:
+            totals[STATUS_KEYS[old_status]] -= 1
+        if new_status in STATUS_KEYS:
+            totals[STATUS_KEYS[new_status]] += 1
+    _changed(apply)
+
+def mission_rated(old_rating, new_rating):
+    """Aggiorna la media voti in cache dopo una (ri)valutazione"""
+    def apply(totals):
+        if old_rating is not None:
+            totals['rating_sum'] -= float(old_rating)
+            totals['rating_count'] -= 1
+        totals['rating_sum'] += float(new_rating)
+        totals['rating_count'] += 1
+    _changed(apply)
+
+def invalidate():
+    """Forza il ricalcolo alla prossima richiesta, in tutti i processi"""
+    global _totals, _generation
+    with _lock:
+        _generation += 1
+        _totals = None
+        refcache.bump(VERSION)
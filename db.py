@@ -1,64 +1,453 @@
-from mysql.connector import pooling, Error
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, has_app_context, has_request_context, session
+from mysql.connector import Error, InterfaceError, OperationalError
 from config import Config
+from pool import ElasticPool, PoolTimeout
+import metrics
+
+logger = logging.getLogger(__name__)
 
 # Ritarda l'inizializzazione del pool fino al primo utilizzo.
 _pool = None
+# Repliche di sola lettura (Config.DB_REPLICAS), ciascuna con il proprio pool
+_replicas = []
+_replica_counter = itertools.count()
+
+class Replica:
+    """Replica di sola lettura; dopo un errore resta esclusa per DB_REPLICA_RETRY secondi"""
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.down_until = 0.0
+        self.failures = 0
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self, error):
+        self.failures += 1
+        self.down_until = time.monotonic() + Config.DB_REPLICA_RETRY
+        logger.warning('Replica %s esclusa per %ss: %s', self.name, Config.DB_REPLICA_RETRY, error)
+
+# Processi che si dividono DB_MAX_CONNECTIONS (impostato da gunicorn.conf.py) e connessioni al
+# primario già impegnate da altri pool del processo (aiomysql in asgi.py)
+_processes = 1
+_reserved = 0
+
+def set_connection_budget(processes=None, reserved=None):
+    """Ripartizione di DB_MAX_CONNECTIONS; da chiamare prima che i pool vengano creati"""
+    global _processes, _reserved
+    if processes is not None:
+        _processes = max(1, processes)
+    if reserved is not None:
+        _reserved = max(0, reserved)
+
+def _pool_limits(reserved=0):
+    """(size, max_overflow) del processo, entro la sua quota di DB_MAX_CONNECTIONS"""
+    size, overflow = Config.DB_POOL_SIZE, Config.DB_POOL_MAX_OVERFLOW
+    if Config.DB_MAX_CONNECTIONS > 0:
+        share = max(1, Config.DB_MAX_CONNECTIONS // _processes - reserved)
+        size = min(size, share)
+        overflow = min(overflow, share - size)
+    return size, overflow
+
+def _new_pool(cfg, reserved=0):
+    size, overflow = _pool_limits(reserved)
+    return ElasticPool(
+        cfg,
+        size=size,
+        max_overflow=overflow,
+        timeout=Config.DB_POOL_TIMEOUT,
+        max_waiters=Config.DB_POOL_MAX_WAITERS,
+        ping_after=Config.DB_POOL_PING_AFTER
+    )
+
+def _replica_config(address):
+    """Stesse credenziali del primario su host[:porta] della replica"""
+    host, _, port = address.partition(':')
+    return dict(Config.DB_CONFIG, host=host, port=int(port) if port else Config.DB_CONFIG['port'])
 
 def _init_pool():
-    global _pool
+    global _pool, _replicas
     if _pool is None:
         cfg = Config.DB_CONFIG
         if not cfg.get('host'):
             raise RuntimeError('Database host non configurato. Impostare DB_HOST o MYSQL_HOST in .env')
         try:
-            _pool = pooling.MySQLConnectionPool(
-                pool_name="droni_pool",
-                pool_size=5,
-                **cfg
-            )
+            _replicas = [Replica(address, _new_pool(_replica_config(address))) for address in Config.DB_REPLICAS]
+            _pool = _new_pool(cfg, _reserved)
         except Error as e:
             # Rilancia con messaggio più chiaro
             raise RuntimeError(f'Impossibile inizializzare il pool DB: {e}') from e
 
+# Pool ereditati dal processo padre: le loro socket sono condivise con il padre, quindi nel figlio
+# non vanno né usate né chiuse (né lasciate al garbage collector, che le chiuderebbe)
+_inherited = []
+
+def _reset_after_fork():
+    """Nel worker appena creato con fork il primo utilizzo crea pool propri"""
+    global _pool, _replicas
+    if _pool is not None:
+        _inherited.append(_pool)
+    _inherited.extend(replica.pool for replica in _replicas)
+    _pool = None
+    _replicas = []
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+# Connessione della transazione attiva nel contesto corrente (richiesta o thread)
+_transaction = ContextVar('db_transaction', default=None)
+
 def get_connection():
     """Ottiene una connessione dal pool, inizializzandolo al bisogno"""
     if _pool is None:
         _init_pool()
     return _pool.get_connection()
 
-def query_one(query, params=None):
-    """Esegue una query e ritorna una singola riga come dizionario"""
+def pool_stats():
+    """Stato del pool (None se non ancora inizializzato)"""
+    return _pool.stats() if _pool is not None else None
+
+def replica_stats():
+    """Stato di salute e pool di ogni replica"""
+    return [{
+        'name': replica.name,
+        'healthy': replica.healthy,
+        'failures': replica.failures,
+        'pool': replica.pool.stats()
+    } for replica in _replicas]
+
+def warm_up():
+    """Apre in anticipo le connessioni stabili del primario e di ogni replica (DB_WARMUP)"""
+    _init_pool()
+    for replica in _replicas:
+        try:
+            replica.pool.warm()
+        except Error as e:
+            replica.mark_down(e)
+    opened = _pool.warm()
+    logger.info('Pool DB pronto: %s connessioni aperte', opened)
+    return opened
+
+def pool_ready():
+    """Stato del pool per la readiness; solleva un errore se il primario non è raggiungibile.
+    Se non c'è ancora nessuna connessione aperta ne apre e verifica una."""
+    _init_pool()
+    stats = _pool.stats()
+    if stats['idle'] + stats['in_use'] == 0:
+        conn = _pool.get_connection()
+        try:
+            conn.ping(reconnect=False)
+        finally:
+            conn.close()
+        stats = _pool.stats()
+    return stats
+
+def _has_replicas():
+    if _pool is None:
+        _init_pool()
+    return bool(_replicas)
+
+def _replica_connection():
+    """(replica, connessione) dalla prossima replica sana in round robin; (None, None) se nessuna"""
+    count = len(_replicas)
+    start = next(_replica_counter)
+    for i in range(count):
+        replica = _replicas[(start + i) % count]
+        if not replica.healthy:
+            continue
+        try:
+            return replica, replica.pool.get_connection()
+        except PoolTimeout:
+            # Replica solo occupata: si prova la successiva senza escluderla
+            continue
+        except Error as e:
+            replica.mark_down(e)
+    return None, None
+
+def _pinned_to_primary():
+    """Dopo una scrittura la sessione legge dal primario per DB_REPLICA_PIN_SECONDS (read-your-writes)"""
+    if not has_request_context():
+        return False
+    return g.get('_db_wrote', False) or session.get('_db_pin', 0) > time.time()
+
+def _wrote():
+    """Registra una scrittura della richiesta corrente per il vincolo al primario"""
+    if _replicas and has_request_context():
+        g._db_wrote = True
+        if Config.DB_REPLICA_PIN_SECONDS > 0:
+            session['_db_pin'] = time.time() + Config.DB_REPLICA_PIN_SECONDS
+
+def init_app(app):
+    """Rilascia la connessione della richiesta alla chiusura del contesto applicativo"""
+    app.teardown_appcontext(_release_request_connection)
+
+def _release_request_connection(exc=None):
+    g.pop('_db_replica', None)
+    for conn in (g.pop('_db_conn', None), g.pop('_db_replica_conn', None)):
+        if conn is None:
+            continue
+        try:
+            # Chiude lo snapshot di lettura aperto dalle SELECT della richiesta
+            conn.rollback()
+        except Error:
+            logger.warning('Rollback della connessione di richiesta fallito', exc_info=True)
+        finally:
+            conn.close()
+
+@contextmanager
+def _connection():
+    """Connessione da usare: quella della transazione attiva, quella della richiesta
+    (una sola per tutte le query di una richiesta Flask) o, fuori da una richiesta, una dal pool"""
+    conn = _transaction.get()
+    if conn is not None:
+        yield conn
+        return
+    
+    if has_app_context():
+        conn = g.get('_db_conn')
+        if conn is None:
+            conn = g._db_conn = get_connection()
+        yield conn
+        return
+    
     conn = get_connection()
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query, params or ())
-        result = cursor.fetchone()
-        cursor.close()
-        return result
+        yield conn
     finally:
         conn.close()
 
-def query_all(query, params=None):
-    """Esegue una query e ritorna tutte le righe come lista di dizionari"""
-    conn = get_connection()
+class _ReplicaFailed(Exception):
+    """La replica ha perso la connessione durante una lettura: si ripete sul primario"""
+
+@contextmanager
+def _read_connection():
+    """Connessione per una SELECT: una replica (la stessa per tutta la richiesta) se configurate,
+    altrimenti, dentro una transazione o con la sessione vincolata al primario, come _connection()"""
+    if _transaction.get() is not None or not _has_replicas() or _pinned_to_primary():
+        with _connection() as conn:
+            yield conn
+        return
+    
+    scoped = has_app_context()
+    replica, conn = (g.get('_db_replica'), g.get('_db_replica_conn')) if scoped else (None, None)
+    if conn is None:
+        replica, conn = _replica_connection()
+        if conn is None:
+            # Nessuna replica disponibile
+            with _connection() as conn:
+                yield conn
+            return
+        if scoped:
+            g._db_replica, g._db_replica_conn = replica, conn
+    
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query, params or ())
-        results = cursor.fetchall()
+        yield conn
+    except (InterfaceError, OperationalError) as e:
+        replica.mark_down(e)
+        conn.discard()
+        if scoped:
+            g.pop('_db_replica', None)
+            g.pop('_db_replica_conn', None)
+            conn.close()
+        raise _ReplicaFailed() from e
+    finally:
+        if not scoped:
+            conn.close()
+
+def _commit(conn):
+    """Commit immediato, salvo dentro transaction() dove il commit è unico alla fine"""
+    if _transaction.get() is None:
+        conn.commit()
+
+@contextmanager
+def transaction():
+    """Esegue più scritture con un solo commit finale; rollback se il blocco solleva un'eccezione.
+    Le transazioni annidate confluiscono in quella esterna."""
+    if _transaction.get() is not None:
+        yield
+        return
+    
+    with _connection() as conn:
+        # Riparte da uno snapshot aggiornato se la richiesta aveva già letto
+        conn.rollback()
+        token = _transaction.set(conn)
+        try:
+            yield
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _transaction.reset(token)
+
+class StatementCache:
+    """Cursori con statement preparato lato server di una connessione, per testo SQL, con evizione LRU"""
+
+    def __init__(self, connection_id, size):
+        self.connection_id = connection_id
+        self.size = size
+        self._cursors = OrderedDict()  # (sql, dictionary) -> (sql, cursore)
+
+    def get(self, conn, query, dictionary):
+        """Cursore già preparato per la query, o uno nuovo che la preparerà alla prima execute"""
+        key = (query, dictionary)
+        entry = self._cursors.get(key)
+        if entry is not None:
+            self._cursors.move_to_end(key)
+            return entry
+        entry = (query, conn.cursor(prepared=True, dictionary=dictionary))
+        self._cursors[key] = entry
+        while len(self._cursors) > self.size:
+            _, (_, evicted) = self._cursors.popitem(last=False)
+            _close_cursor(evicted)
+        return entry
+
+    def drop(self, query, dictionary):
+        entry = self._cursors.pop((query, dictionary), None)
+        if entry is not None:
+            _close_cursor(entry[1])
+
+def _close_cursor(cursor):
+    try:
+        # Rilascia anche lo statement sul server
         cursor.close()
-        return results
+    except Error:
+        pass
+
+def _statement_cache(conn):
+    """Cache degli statement della connessione fisica; svuotata se nel frattempo si è riconnessa"""
+    raw = getattr(conn, 'connection', conn)
+    cache = getattr(raw, '_statement_cache', None)
+    if cache is None or cache.connection_id != raw.connection_id:
+        cache = raw._statement_cache = StatementCache(raw.connection_id, Config.DB_STATEMENT_CACHE_SIZE)
+    return cache
+
+def _fetch(query, params, dictionary, primary=False):
+    """Esegue una SELECT e ne ritorna tutte le righe, registrandone durata e dimensione"""
+    start = time.perf_counter()
+    if primary:
+        results = _run_select(query, params, dictionary, _connection)
+    else:
+        results = _select(query, params, dictionary)
+    metrics.record_query(query, time.perf_counter() - start, len(results))
+    return results
+
+def _select(query, params, dictionary):
+    """Esegue una SELECT su una replica, ripetendola sul primario se la replica cade"""
+    try:
+        return _run_select(query, params, dictionary, _read_connection)
+    except _ReplicaFailed:
+        return _run_select(query, params, dictionary, _connection)
+
+def _run_select(query, params, dictionary, connection):
+    """Esegue una SELECT e ne ritorna tutte le righe, con statement preparato se abilitato"""
+    with connection() as conn:
+        if not Config.DB_PREPARED_STATEMENTS:
+            cursor = conn.cursor(dictionary=dictionary)
+            cursor.execute(query, params or ())
+            results = cursor.fetchall()
+            cursor.close()
+            return results
+        
+        cache = _statement_cache(conn)
+        # Stesso oggetto stringa della prima esecuzione: il cursore riconosce la query e salta la
+        # PREPARE, ma il connettore invia comunque COM_STMT_RESET prima di ogni nuova esecuzione
+        sql, cursor = cache.get(conn, query, dictionary)
+        try:
+            cursor.execute(sql, tuple(params or ()))
+            return cursor.fetchall()
+        except Exception:
+            cache.drop(query, dictionary)
+            raise
+
+def query_one(query, params=None, primary=False):
+    """Esegue una query e ritorna una singola riga come dizionario (primary=True: mai da una replica)"""
+    # Legge tutte le righe: quelle non lette bloccherebbero le query successive sulla stessa connessione
+    results = _fetch(query, params, True, primary)
+    return results[0] if results else None
+
+def query_all(query, params=None, primary=False):
+    """Esegue una query e ritorna tutte le righe come lista di dizionari (primary=True: mai da una replica)"""
+    return _fetch(query, params, True, primary)
+
+def query_rows(query, params=None, primary=False):
+    """Esegue una query e ritorna tutte le righe come tuple, senza costruire dizionari"""
+    return _fetch(query, params, False, primary)
+
+def stream(query, params=None, size=500):
+    """Genera le righe (tuple) di una query da un cursore non bufferizzato, a blocchi di `size`.
+    Usa sempre una connessione dedicata (di una replica, se disponibile), dato che le righe
+    restano in sospeso sul socket."""
+    # Scelta fatta subito, nella view: il generatore gira dopo la fine del contesto di richiesta,
+    # dove il vincolo al primario dopo una scrittura della sessione non sarebbe più visibile
+    replica = _transaction.get() is None and _has_replicas() and not _pinned_to_primary()
+    return _stream(query, params, size, replica)
+
+def _stream(query, params, size, replica):
+    start = time.perf_counter()
+    count = 0
+    conn = None
+    if replica:
+        _, conn = _replica_connection()
+    if conn is None:
+        conn = get_connection()
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(query, params or ())
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            count += len(rows)
+            yield from rows
     finally:
-        conn.close()
+        metrics.record_query(query, time.perf_counter() - start, count)
+        try:
+            # Interruzione anticipata (es. client disconnesso): la connessione viene chiusa invece
+            # di leggere fino in fondo le righe rimaste; cursor.close() qui fallirebbe con
+            # "Unread result found"
+            if conn.unread_result:
+                conn.discard()
+            else:
+                cursor.close()
+        except Error:
+            conn.discard()
+        finally:
+            # Sempre restituita al pool, altrimenti il posto resterebbe occupato per sempre
+            conn.close()
 
 def execute(query, params=None):
     """Esegue una query INSERT/UPDATE/DELETE e ritorna l'ID dell'ultima riga"""
-    conn = get_connection()
-    try:
+    start = time.perf_counter()
+    with _connection() as conn:
         cursor = conn.cursor()
         cursor.execute(query, params or ())
-        conn.commit()
+        _commit(conn)
         last_id = cursor.lastrowid
+        count = cursor.rowcount
         cursor.close()
-        return last_id
-    finally:
-        conn.close()
+    _wrote()
+    metrics.record_query(query, time.perf_counter() - start, max(count, 0))
+    return last_id
+
+def execute_many(query, rows):
+    """Esegue una INSERT su più righe con un solo commit e ritorna il numero di righe scritte"""
+    start = time.perf_counter()
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(query, rows)
+        _commit(conn)
+        count = cursor.rowcount
+        cursor.close()
+    _wrote()
+    metrics.record_query(query, time.perf_counter() - start, max(count, 0))
+    return count
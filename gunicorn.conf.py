@@ -0,0 +1,48 @@
+"""Configurazione gunicorn (gunicorn -c gunicorn.conf.py wsgi:app), valori da Config/.env.
+
+L'app viene caricata una volta nel master (preload) e i worker nascono con fork: pool DB, writer
+di telemetria, feed live e pool di hashing vengono ricreati in ogni worker al primo utilizzo.
+Con DB_MAX_CONNECTIONS impostato ogni worker apre al più DB_MAX_CONNECTIONS // WEB_WORKERS
+connessioni per server MySQL. Con DB_WARMUP=1 ogni worker apre le sue DB_POOL_SIZE connessioni
+prima di accettare richieste.
+
+Uno stream SSE occupa un thread del worker per tutta la durata della visione: con WEB_THREADS
+thread per worker pochi spettatori bloccherebbero le altre richieste. Sotto gunicorn lo stream è
+quindi disattivato (LIVE_SSE=0 se non impostato diversamente) e il client segue la missione con il
+polling incrementale di /tracks, che tiene un thread solo per la durata della richiesta. Per lo
+stream in tempo reale il proxy può instradare /api/missions/<id>/tracks/stream a un processo
+uvicorn asgi:application, che lo serve in asyncio.
+"""
+import os
+
+# Prima di importare Config, che legge l'ambiente una volta sola
+os.environ.setdefault('LIVE_SSE', '0')
+
+from config import Config
+import db
+
+bind = Config.WEB_BIND
+workers = Config.WEB_WORKERS
+# Solo qui DB_MAX_CONNECTIONS è diviso tra i worker; flask run e uvicorn usano un solo processo
+db.set_connection_budget(processes=workers)
+threads = Config.WEB_THREADS
+worker_class = 'gthread'
+preload_app = True
+timeout = Config.WEB_TIMEOUT
+
+def when_ready(server):
+    if Config.DB_MAX_CONNECTIONS > 0:
+        share = Config.DB_MAX_CONNECTIONS // max(1, Config.WEB_WORKERS)
+        server.log.info('Connessioni DB: %s per worker su %s totali', share, Config.DB_MAX_CONNECTIONS)
+        if share < Config.WEB_THREADS:
+            server.log.warning('Quota DB per worker (%s) inferiore a WEB_THREADS (%s): '
+                               'le richieste attenderanno una connessione libera', share, Config.WEB_THREADS)
+
+def post_worker_init(worker):
+    if not Config.DB_WARMUP:
+        return
+    try:
+        db.warm_up()
+    except Exception:
+        # Il worker parte comunque: /api/health/ready resta 503 finché il database non risponde
+        worker.log.exception('Warm-up del pool DB non riuscito')
@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+from config import Config
+
+class HashingBusy(Exception):
+    """Pool di hashing saturo o risposta oltre HASH_TIMEOUT"""
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_method_prefix = None
+
+def _get_executor():
+    """Pool di processi dedicato all'hashing, avviato al primo utilizzo"""
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            # spawn: i worker non ereditano thread e connessioni del processo web
+            _executor = ProcessPoolExecutor(
+                max_workers=Config.HASH_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            # Calcoli in esecuzione più quelli in coda; oltre si rifiuta subito
+            _slots = threading.BoundedSemaphore(Config.HASH_WORKERS + Config.HASH_QUEUE_SIZE)
+        return _executor, _slots
+
+def _reset(executor):
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _reset_after_fork():
+    """Il pool del padre non è utilizzabile nel figlio (manca il suo thread di gestione):
+    il worker ne crea uno proprio, senza chiudere i processi del padre"""
+    global _lock, _executor, _slots
+    _lock = threading.Lock()
+    _executor = None
+    _slots = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _run(fn, *args):
+    """Esegue fn nel pool senza bloccare il GIL del processo web; con HASH_WORKERS=0 in linea"""
+    if Config.HASH_WORKERS <= 0:
+        return fn(*args)
+
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy('Troppe richieste di autenticazione in corso')
+    try:
+        future = executor.submit(fn, *args)
+    except BrokenProcessPool:
+        slots.release()
+        _reset(executor)
+        raise
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return future.result(timeout=Config.HASH_TIMEOUT)
+    except TimeoutError:
+        future.cancel()
+        raise HashingBusy('Autenticazione non completata in tempo')
+    except BrokenProcessPool:
+        # Un worker è terminato in modo anomalo: il prossimo utilizzo ricrea il pool
+        _reset(executor)
+        raise
+
+def check_password(pwhash, password):
+    """Verifica la password contro l'hash salvato"""
+    return _run(check_password_hash, pwhash, password)
+
+def hash_password(password):
+    """Hash della password con il metodo configurato (PASSWORD_HASH_METHOD)"""
+    return _run(generate_password_hash, password, Config.PASSWORD_HASH_METHOD)
+
+def needs_rehash(pwhash):
+    """True se l'hash salvato usa un metodo o parametri diversi da quelli configurati"""
+    global _method_prefix
+    if _method_prefix is None:
+        # Forma normalizzata del metodo (es. 'scrypt' -> 'scrypt:32768:8:1'), calcolata una volta
+        _method_prefix = hash_password('').split('$', 1)[0]
+    return pwhash.split('$', 1)[0] != _method_prefix
@@ -0,0 +1,233 @@
+import logging
+import os
+import queue
+import threading
+from config import Config
+from db import query_one, query_all
+import serialization
+
+logger = logging.getLogger(__name__)
+
+# Stati oltre i quali la missione non produce più tracce
+TERMINAL_STATES = ('completata', 'annullata')
+
+# Un solo feed (e un solo loop di polling) per missione, condiviso da tutti gli spettatori
+_feeds = {}
+_lock = threading.Lock()
+
+# Funzioni chiamate da notify() oltre ai feed di questo modulo (es. gli stream asincroni di asgi.py)
+_listeners = []
+
+def format_event(name, data):
+    """Serializza un evento SSE una volta sola per tutti gli iscritti"""
+    return f"event: {name}\ndata: {serialization.dumps(data)}\n\n"
+
+# Query di un feed: punti della missione (con cursore) e stato
+TRACKS_QUERY = """
+    SELECT
+        Latitudine as lat,
+        Longitudine as lng,
+        TIMESTAMP as timestamp
+    FROM Traccia
+    WHERE ID_Missione = %s
+"""
+STATUS_QUERY = "SELECT Stato FROM Missione WHERE ID = %s"
+
+class Subscriber:
+    """Coda di eventi di un singolo spettatore"""
+
+    # asgi.py usa la stessa classe con la coda di asyncio
+    Queue, Full = queue.Queue, queue.Full
+
+    def __init__(self):
+        self.queue = self.Queue(maxsize=Config.LIVE_QUEUE_SIZE)
+        self.closed = False
+
+    def push(self, event):
+        """Accoda un evento; uno spettatore troppo lento viene disconnesso"""
+        try:
+            self.queue.put_nowait(event)
+        except self.Full:
+            self.closed = True
+
+    def close(self):
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except self.Full:
+            pass
+
+def _point_key(track):
+    return track['timestamp'], track['lat'], track['lng']
+
+class Feed:
+    """Punti, cursore, stato e iscritti di un feed di missione, senza I/O: MissionFeed (thread)
+    e asgi.MissionFeed (asyncio) eseguono le query e passano il risultato a update()"""
+
+    def __init__(self, mission_id):
+        self.mission_id = mission_id
+        self.points = []
+        self.seen = set()
+        self.cursor = None
+        self.status = None
+        self.subscribers = set()
+        self.closed = False
+
+    def add(self, subscriber):
+        """Iscrive uno spettatore inviandogli lo stato corrente"""
+        self.subscribers.add(subscriber)
+        subscriber.push(format_event('snapshot', self.points))
+        if self.status:
+            subscriber.push(format_event('status', {'status': self.status}))
+
+    def _publish(self, event):
+        for subscriber in list(self.subscribers):
+            subscriber.push(event)
+            if subscriber.closed:
+                self.subscribers.discard(subscriber)
+
+    def tracks_query(self):
+        """(query, parametri) dei punti da leggere al prossimo aggiornamento"""
+        query, params = TRACKS_QUERY, [self.mission_id]
+        if self.cursor:
+            # Rilegge anche la finestra dei punti scritti in ritardo; i duplicati sono scartati in update()
+            query += " AND TIMESTAMP > DATE_SUB(%s, INTERVAL %s SECOND)"
+            params.extend((self.cursor, Config.TRACK_LATE_WINDOW))
+        return query + " ORDER BY TIMESTAMP ASC", tuple(params)
+
+    def update(self, tracks, mission):
+        """Applica il risultato delle query e pubblica i punti nuovi e il cambio di stato"""
+        status = mission['Stato'] if mission else None
+        # Coordinate DECIMAL convertite prima di toccare cursore e punti del feed
+        tracks = [{
+            'lat': float(t['lat']),
+            'lng': float(t['lng']),
+            'timestamp': str(t['timestamp']) if t['timestamp'] else None
+        } for t in tracks]
+
+        if tracks:
+            self.cursor = max(self.cursor or '', tracks[-1]['timestamp'])
+        tracks = [t for t in tracks if _point_key(t) not in self.seen]
+        if tracks:
+            self.seen.update(_point_key(t) for t in tracks)
+            self.points.extend(tracks)
+            self._publish(format_event('points', tracks))
+        if status != self.status:
+            self.status = status
+            self._publish(format_event('status', {'status': status}))
+
+    @property
+    def finished(self):
+        """Missione terminata o inesistente: niente altri aggiornamenti"""
+        return self.status is None or self.status in TERMINAL_STATES
+
+    def close(self):
+        """Invia l'evento finale e chiude tutti gli stream collegati"""
+        self.closed = True
+        self._publish(format_event('end', {'status': self.status}))
+        for subscriber in self.subscribers:
+            subscriber.close()
+        self.subscribers.clear()
+
+class MissionFeed(Feed):
+    """Feed aggiornato da un thread di polling, con lo stato protetto da _lock"""
+
+    def __init__(self, mission_id):
+        super().__init__(mission_id)
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name=f'mission-feed-{mission_id}', daemon=True
+        )
+
+    def _poll(self):
+        """Legge i nuovi punti e lo stato della missione"""
+        query, params = self.tracks_query()
+        tracks = query_all(query, params)
+        mission = query_one(STATUS_QUERY, (self.mission_id,))
+        with _lock:
+            self.update(tracks, mission)
+
+    def _close(self):
+        """Chiude il feed (da chiamare con _lock)"""
+        _feeds.pop(self.mission_id, None)
+        self.close()
+
+    def _run(self):
+        first = True
+        while True:
+            if not first:
+                self.wakeup.wait(Config.LIVE_POLL_INTERVAL)
+                self.wakeup.clear()
+            first = False
+
+            with _lock:
+                if not self.subscribers:
+                    self.closed = True
+                    _feeds.pop(self.mission_id, None)
+                    return
+
+            try:
+                self._poll()
+            except Exception:
+                logger.exception('Errore aggiornamento feed missione %s', self.mission_id)
+                continue
+
+            if self.finished:
+                with _lock:
+                    self._close()
+                return
+
+def subscribe(mission_id):
+    """Iscrive uno spettatore al feed della missione, avviandolo se necessario"""
+    subscriber = Subscriber()
+    with _lock:
+        feed = _feeds.get(mission_id)
+        if feed is None or feed.closed:
+            feed = MissionFeed(mission_id)
+            _feeds[mission_id] = feed
+            feed.thread.start()
+        feed.add(subscriber)
+    return subscriber
+
+def unsubscribe(mission_id, subscriber):
+    """Rimuove lo spettatore; il feed si ferma da solo quando resta senza iscritti"""
+    subscriber.closed = True
+    with _lock:
+        feed = _feeds.get(mission_id)
+        if feed:
+            feed.subscribers.discard(subscriber)
+
+def notify(mission_id):
+    """Sveglia subito il feed della missione (nuovi punti o cambio stato)"""
+    feed = _feeds.get(mission_id)
+    if feed:
+        feed.wakeup.set()
+    for listener in _listeners:
+        listener(mission_id)
+
+def add_listener(listener):
+    """Registra una funzione chiamata con l'ID missione a ogni notify()"""
+    _listeners.append(listener)
+
+def _reset_after_fork():
+    """I thread di polling dei feed non sopravvivono al fork: il worker ne avvia di propri"""
+    global _feeds, _lock
+    _feeds = {}
+    _lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def stream(mission_id, subscriber):
+    """Generatore SSE per uno spettatore, con keepalive periodico"""
+    try:
+        while not subscriber.closed or not subscriber.queue.empty():
+            try:
+                event = subscriber.queue.get(timeout=Config.LIVE_KEEPALIVE)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                break
+            yield event
+    finally:
+        unsubscribe(mission_id, subscriber)
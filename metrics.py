@@ -0,0 +1,181 @@
+import bisect
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+from flask import g, has_request_context
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Limiti superiori (secondi) degli istogrammi di latenza
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Oltre questo numero di query distinte le nuove finiscono sotto un'unica etichetta
+MAX_FINGERPRINTS = 500
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROW_LIST = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_SPACES = re.compile(r'\s+')
+
+class Histogram:
+    """Conteggi per bucket, somma e numero di osservazioni"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+_lock = threading.Lock()
+_queries = {}   # fingerprint -> [Histogram durata, righe totali]
+_requests = {}  # (endpoint, metodo) -> Histogram
+_statuses = {}  # (endpoint, metodo, status) -> conteggio
+_request_queries = {}  # endpoint -> query eseguite
+
+@lru_cache(maxsize=1024)
+def fingerprint(query):
+    """SQL normalizzato: letterali e parametri come ?, liste IN e VALUES compattate, spazi uniformi"""
+    query = _STRING.sub('?', query)
+    query = _NUMBER.sub('?', query)
+    query = _PLACEHOLDER.sub('?', query)
+    query = _IN_LIST.sub('(...)', query)
+    query = _ROW_LIST.sub('(...)', query)
+    return _SPACES.sub(' ', query).strip()
+
+def record_query(query, duration, rows):
+    """Registra una query eseguita; oltre SLOW_QUERY_MS la scrive anche nel log"""
+    fp = fingerprint(query)
+    with _lock:
+        entry = _queries.get(fp)
+        if entry is None:
+            if len(_queries) >= MAX_FINGERPRINTS:
+                fp = 'other'
+                entry = _queries.get(fp)
+            if entry is None:
+                entry = _queries[fp] = [Histogram(), 0]
+        entry[0].observe(duration)
+        entry[1] += rows
+    if has_request_context():
+        g._metrics_queries = g.get('_metrics_queries', 0) + 1
+    if Config.SLOW_QUERY_MS and duration * 1000 >= Config.SLOW_QUERY_MS:
+        logger.warning('Query lenta (%.1f ms, %d righe): %s', duration * 1000, rows, fp)
+
+def record_request(endpoint, method, status, duration):
+    """Registra latenza, status e numero di query di una richiesta HTTP"""
+    queries = g.get('_metrics_queries', 0)
+    with _lock:
+        histogram = _requests.get((endpoint, method))
+        if histogram is None:
+            histogram = _requests[(endpoint, method)] = Histogram()
+        histogram.observe(duration)
+        key = (endpoint, method, status)
+        _statuses[key] = _statuses.get(key, 0) + 1
+        _request_queries[endpoint] = _request_queries.get(endpoint, 0) + queries
+
+def snapshot():
+    """Per route: richieste servite e query DB eseguite"""
+    with _lock:
+        routes = {}
+        for (endpoint, _, _), count in _statuses.items():
+            routes.setdefault(endpoint, {'requests': 0, 'queries': 0})['requests'] += count
+        for endpoint, count in _request_queries.items():
+            routes.setdefault(endpoint, {'requests': 0, 'queries': 0})['queries'] = count
+        return routes
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+def _histogram_lines(name, histogram, labels):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}')
+    lines.append(f'{name}_sum{_labels(**labels)} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{_labels(**labels)} {histogram.count}')
+    return lines
+
+def _pool_lines(pool):
+    lines = [
+        '# HELP db_pool_connections Connessioni del pool per stato',
+        '# TYPE db_pool_connections gauge',
+        f'db_pool_connections{_labels(state="in_use")} {pool["in_use"]}',
+        f'db_pool_connections{_labels(state="idle")} {pool["idle"]}',
+        '# HELP db_pool_waiters Richieste in attesa di una connessione',
+        '# TYPE db_pool_waiters gauge',
+        f'db_pool_waiters {pool["waiters"]}',
+        '# HELP db_pool_timeouts_total Checkout falliti per timeout o coda piena',
+        '# TYPE db_pool_timeouts_total counter',
+        f'db_pool_timeouts_total {pool["timeouts"] + pool["rejected"]}',
+        '# HELP db_pool_wait_seconds Attesa al checkout di una connessione',
+        '# TYPE db_pool_wait_seconds histogram'
+    ]
+    wait = pool['wait_seconds']
+    for bucket in wait['buckets']:
+        lines.append(f'db_pool_wait_seconds_bucket{_labels(le=bucket["le"])} {bucket["count"]}')
+    lines.append(f'db_pool_wait_seconds_sum {wait["sum"]}')
+    lines.append(f'db_pool_wait_seconds_count {wait["count"]}')
+    return lines
+
+def render(pool=None):
+    """Tutte le metriche nel formato testuale di Prometheus"""
+    lines = []
+    with _lock:
+        lines += [
+            '# HELP http_request_duration_seconds Latenza delle richieste per route',
+            '# TYPE http_request_duration_seconds histogram'
+        ]
+        for (endpoint, method), histogram in sorted(_requests.items()):
+            lines += _histogram_lines('http_request_duration_seconds', histogram,
+                                      {'endpoint': endpoint, 'method': method})
+        lines += [
+            '# HELP http_requests_total Richieste per route e status',
+            '# TYPE http_requests_total counter'
+        ]
+        for (endpoint, method, status), count in sorted(_statuses.items()):
+            lines.append(f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+        lines += [
+            '# HELP http_request_db_queries_total Query DB eseguite dalle richieste per route',
+            '# TYPE http_request_db_queries_total counter'
+        ]
+        for endpoint, count in sorted(_request_queries.items()):
+            lines.append(f'http_request_db_queries_total{_labels(endpoint=endpoint)} {count}')
+        lines += [
+            '# HELP db_query_duration_seconds Durata delle query per SQL normalizzato',
+            '# TYPE db_query_duration_seconds histogram'
+        ]
+        for fp, (histogram, _) in sorted(_queries.items()):
+            lines += _histogram_lines('db_query_duration_seconds', histogram, {'query': fp})
+        lines += [
+            '# HELP db_query_rows_total Righe lette o scritte per SQL normalizzato',
+            '# TYPE db_query_rows_total counter'
+        ]
+        for fp, (_, rows) in sorted(_queries.items()):
+            lines.append(f'db_query_rows_total{_labels(query=fp)} {rows}')
+    if pool is not None:
+        lines += _pool_lines(pool)
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    """Azzera tutte le metriche"""
+    with _lock:
+        _queries.clear()
+        _requests.clear()
+        _statuses.clear()
+        _request_queries.clear()
+
+# Ogni worker espone solo le proprie metriche, senza quelle del processo padre prima del fork
+os.register_at_fork(after_in_child=reset)
@@ -0,0 +1,219 @@
+import bisect
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector
+from mysql.connector import Error
+from mysql.connector.errors import PoolError
+
+logger = logging.getLogger(__name__)
+
+# Limiti superiori (secondi) dell'istogramma dei tempi di attesa al checkout
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+class PoolTimeout(PoolError):
+    """Nessuna connessione libera entro il timeout, o coda di attesa piena"""
+
+class PooledConnection:
+    """Connessione prestata dal pool: close() la restituisce invece di chiuderla"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._discard = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @property
+    def connection(self):
+        """Connessione mysql-connector sottostante, che resta la stessa tra un prestito e l'altro"""
+        return self._conn
+
+    def discard(self):
+        """Chiude davvero la connessione alla restituzione (es. stato del socket incerto)"""
+        self._discard = True
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(conn, self._discard)
+
+class ElasticPool:
+    """Pool con `size` connessioni stabili più `max_overflow` temporanee.
+    A pool esaurito le richieste attendono in coda (al massimo `max_waiters`) fino a `timeout`."""
+
+    def __init__(self, db_config, size=5, max_overflow=5, timeout=5.0, max_waiters=50, ping_after=30.0):
+        self.db_config = db_config
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.max_waiters = max_waiters
+        self.ping_after = ping_after
+        self._idle = []  # (connessione, istante di rilascio), la più recente in fondo
+        self._cond = threading.Condition()
+        self._total = 0
+        self._waiters = 0
+        self.checkouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self._wait_counts = [0] * (len(WAIT_BUCKETS) + 1)
+        self._wait_sum = 0.0
+
+    def _connect(self):
+        return mysql.connector.connect(**self.db_config)
+
+    def _usable(self, conn, idle_since):
+        """Verifica le connessioni rimaste inattive a lungo: il server può averle chiuse"""
+        if time.monotonic() - idle_since < self.ping_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def _record_wait(self, waited):
+        self._wait_counts[bisect.bisect_left(WAIT_BUCKETS, waited)] += 1
+        self._wait_sum += waited
+
+    def get_connection(self):
+        """Presta una connessione, attendendo se tutte sono in uso"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._total < self.size + self.max_overflow:
+                    conn, idle_since = None, None
+                    self._total += 1
+                    break
+                if self._waiters >= self.max_waiters:
+                    self.rejected += 1
+                    raise PoolTimeout('Pool DB esaurito: troppe richieste in attesa')
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f'Nessuna connessione DB libera entro {self.timeout}s')
+                self._waiters += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+            self.checkouts += 1
+            self._record_wait(time.monotonic() - start)
+
+        # Ping e apertura fuori dal lock, per non bloccare gli altri checkout
+        if conn is not None and not self._usable(conn, idle_since):
+            logger.info('Connessione DB inattiva non più valida, riaperta')
+            self._close(conn)
+            conn = None
+            with self._cond:
+                self.discarded += 1
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.created += 1
+        return PooledConnection(self, conn)
+
+    def _open_checked(self):
+        conn = self._connect()
+        try:
+            conn.ping(reconnect=False)
+        except Exception:
+            self._close(conn)
+            raise
+        return conn
+
+    def warm(self):
+        """Apre e verifica in parallelo le connessioni stabili mancanti (fino a `size`);
+        ritorna quante ne ha aperte e rilancia il primo errore dopo aver tenuto quelle riuscite"""
+        with self._cond:
+            missing = max(0, min(self.size - len(self._idle), self.size + self.max_overflow - self._total))
+            self._total += missing
+        if not missing:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=missing, thread_name_prefix='db-warmup') as executor:
+            futures = [executor.submit(self._open_checked) for _ in range(missing)]
+        opened, errors = [], []
+        for future in futures:
+            try:
+                opened.append(future.result())
+            except Exception as e:
+                errors.append(e)
+
+        now = time.monotonic()
+        with self._cond:
+            self._total -= len(errors)
+            self.created += len(opened)
+            self._idle.extend((conn, now) for conn in opened)
+            self._cond.notify_all()
+        if errors:
+            raise errors[0]
+        return len(opened)
+
+    def _release(self, conn, discard=False):
+        if not discard:
+            try:
+                # Nessuna transazione o risultato pendente passa al prossimo utilizzatore
+                if conn.unread_result:
+                    discard = True
+                elif conn.in_transaction:
+                    conn.rollback()
+            except Error:
+                discard = True
+        with self._cond:
+            # Le connessioni oltre `size` sono temporanee: chiuse appena tornano libere
+            if discard or len(self._idle) >= self.size:
+                self._total -= 1
+                if discard:
+                    self.discarded += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._close(conn)
+
+    def stats(self):
+        """Stato del pool e istogramma cumulativo dei tempi di attesa"""
+        with self._cond:
+            cumulative, buckets = 0, []
+            for bound, count in zip(WAIT_BUCKETS + (float('inf'),), self._wait_counts):
+                cumulative += count
+                buckets.append({'le': bound if bound != float('inf') else '+Inf', 'count': cumulative})
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'in_use': self._total - len(self._idle),
+                'idle': len(self._idle),
+                'waiters': self._waiters,
+                'checkouts': self.checkouts,
+                'created': self.created,
+                'discarded': self.discarded,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'wait_seconds': {
+                    'sum': round(self._wait_sum, 6),
+                    'count': cumulative,
+                    'buckets': buckets
+                }
+            }
@@ -0,0 +1,66 @@
+import gzip
+import os
+import tempfile
+import threading
+from config import Config
+import serialization
+
+# Corpo JSON già serializzato per risorsa: nome -> (versione, etag, corpo, corpo gzip o None)
+_entries = {}
+# Versione letta dal file: nome -> ((inode, mtime), versione)
+_versions = {}
+_lock = threading.Lock()
+
+def _path(name):
+    return os.path.join(Config.CACHE_VERSION_DIR, f'{name}.version')
+
+def bump(name):
+    """Nuova versione della risorsa (ritornata), visibile a tutti i processi che condividono CACHE_VERSION_DIR"""
+    os.makedirs(Config.CACHE_VERSION_DIR, exist_ok=True)
+    value = os.urandom(8).hex()
+    fd, tmp = tempfile.mkstemp(dir=Config.CACHE_VERSION_DIR, prefix=f'.{name}.')
+    with os.fdopen(fd, 'w') as f:
+        f.write(value)
+    # Sostituzione atomica: un lettore vede sempre la versione vecchia o quella nuova
+    os.replace(tmp, _path(name))
+    return value
+
+def version(name):
+    """Versione corrente della risorsa; il file viene riletto solo se è cambiato"""
+    path = _path(name)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        bump(name)
+        st = os.stat(path)
+    key = (st.st_ino, st.st_mtime_ns)
+    with _lock:
+        cached = _versions.get(name)
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(path) as f:
+        value = f.read().strip()
+    with _lock:
+        _versions[name] = (key, value)
+    return value
+
+def get(name, loader, gzipped=False):
+    """(etag, corpo, codifica) della risorsa: loader(), serializzazione e compressione solo quando
+    la versione cambia; con gzipped=True la variante gzip (oltre GZIP_MIN_SIZE) con un ETag forte proprio"""
+    current = version(name)
+    with _lock:
+        entry = _entries.get(name)
+    if not entry or entry[0] != current:
+        body = serialization.dumps_bytes(loader()) + b'\n'
+        compressed = None
+        if len(body) >= Config.GZIP_MIN_SIZE:
+            # mtime=0: stessi byte in ogni processo per la stessa versione, come richiede l'ETag forte
+            compressed = gzip.compress(body, compresslevel=Config.GZIP_LEVEL, mtime=0)
+        entry = (current, f'{name}-{current}', body, compressed)
+        with _lock:
+            _entries[name] = entry
+
+    _, etag, body, compressed = entry
+    if gzipped and compressed is not None:
+        return f'{etag}-gzip', compressed, 'gzip'
+    return etag, body, None
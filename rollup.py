@@ -0,0 +1,109 @@
+import logging
+from mysql.connector import errorcode, Error
+from db import query_one, query_all, execute, transaction
+
+logger = logging.getLogger(__name__)
+
+# Conteggio missioni per (data, stato), mantenuto dai trigger su Missione
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS MissioneGiornaliera (
+        Data DATE NOT NULL,
+        Stato VARCHAR(20) NOT NULL,
+        Conteggio INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (Data, Stato)
+    )
+"""
+
+# Variazione di una riga del rollup; le chiavi NULL non sono contate (come in rebuild)
+_ADJUST = """
+        IF {row}.DataMissione IS NOT NULL AND {row}.Stato IS NOT NULL THEN
+            INSERT INTO MissioneGiornaliera (Data, Stato, Conteggio)
+            VALUES ({row}.DataMissione, {row}.Stato, {delta})
+            ON DUPLICATE KEY UPDATE Conteggio = Conteggio + VALUES(Conteggio);
+        END IF;"""
+
+# Ogni scrittura su Missione, anche fuori dall'app, aggiorna il rollup nella stessa transazione.
+# Nell'UPDATE le due righe sono bloccate in ordine di chiave (Data, Stato): due cambi di stato
+# opposti nello stesso giorno non possono attendersi a vicenda (deadlock)
+TRIGGERS = {
+    'MissioneGiornaliera_ins': f"""
+        CREATE TRIGGER MissioneGiornaliera_ins AFTER INSERT ON Missione FOR EACH ROW
+        BEGIN{_ADJUST.format(row='NEW', delta=1)}
+        END
+    """,
+    'MissioneGiornaliera_del': f"""
+        CREATE TRIGGER MissioneGiornaliera_del AFTER DELETE ON Missione FOR EACH ROW
+        BEGIN{_ADJUST.format(row='OLD', delta=-1)}
+        END
+    """,
+    'MissioneGiornaliera_upd': f"""
+        CREATE TRIGGER MissioneGiornaliera_upd AFTER UPDATE ON Missione FOR EACH ROW
+        BEGIN
+            IF NOT (OLD.DataMissione <=> NEW.DataMissione AND OLD.Stato <=> NEW.Stato) THEN
+                IF (OLD.DataMissione, OLD.Stato) < (NEW.DataMissione, NEW.Stato) THEN{_ADJUST.format(row='OLD', delta=-1)}{_ADJUST.format(row='NEW', delta=1)}
+                ELSE{_ADJUST.format(row='NEW', delta=1)}{_ADJUST.format(row='OLD', delta=-1)}
+                END IF;
+            END IF;
+        END
+    """
+}
+
+# Stessi conteggi calcolati al volo da Missione, finché il rollup non è stato creato
+LIVE_COUNTS = """(
+    SELECT DataMissione as Data, Stato, COUNT(*) as Conteggio
+    FROM Missione
+    WHERE DataMissione IS NOT NULL AND Stato IS NOT NULL
+    GROUP BY DataMissione, Stato
+)"""
+
+def rebuild():
+    """Crea tabella e trigger se mancano e ricalcola il rollup da Missione; ritorna il numero di righe"""
+    execute(SCHEMA)
+    # Trigger prima del ricalcolo: le missioni scritte nel frattempo sono già contate da Missione
+    for name, ddl in TRIGGERS.items():
+        execute(f"DROP TRIGGER IF EXISTS {name}")
+        execute(ddl)
+    # Svuotamento e ricalcolo visibili insieme
+    with transaction():
+        execute("DELETE FROM MissioneGiornaliera")
+        execute(f"""
+            INSERT INTO MissioneGiornaliera (Data, Stato, Conteggio)
+            SELECT Data, Stato, Conteggio FROM {LIVE_COUNTS} c
+        """)
+    return query_one("SELECT COUNT(*) as count FROM MissioneGiornaliera")['count']
+
+def daily_counts(days=10, dal=None, al=None):
+    """Conteggi per data e stato: ultime `days` date con missioni, oppure l'intervallo dal/al"""
+    try:
+        return _daily_counts('MissioneGiornaliera', days, dal, al)
+    except Error as e:
+        if e.errno != errorcode.ER_NO_SUCH_TABLE:
+            raise
+        logger.warning('Rollup missioni assente (eseguire `flask rollup-rebuild`): conteggi da Missione')
+        return _daily_counts(LIVE_COUNTS, days, dal, al)
+
+def _daily_counts(source, days, dal, al):
+    if dal or al:
+        query = f"SELECT Data as date, Stato as status, Conteggio as count FROM {source} r WHERE Conteggio > 0"
+        params = []
+        if dal:
+            query += " AND Data >= %s"
+            params.append(dal)
+        if al:
+            query += " AND Data <= %s"
+            params.append(al)
+        return query_all(query + " ORDER BY Data", tuple(params))
+
+    return query_all(f"""
+        SELECT r.Data as date, r.Stato as status, r.Conteggio as count
+        FROM {source} r
+        JOIN (
+            SELECT DISTINCT Data
+            FROM {source} s
+            WHERE Conteggio > 0
+            ORDER BY Data DESC
+            LIMIT %s
+        ) d ON r.Data = d.Data
+        WHERE r.Conteggio > 0
+        ORDER BY r.Data
+    """, (days,))
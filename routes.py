@@ -1,33 +1,74 @@
-from flask import Blueprint, render_template
+import gzip
+import hashlib
+import os
+import threading
+from flask import Blueprint, Response, current_app, render_template, request
 from auth import login_required, role_required
+from config import Config
+import assets
 
 web = Blueprint('web', __name__)
 
+# Pagine pre-renderizzate: template -> (stamp, etag, corpo, corpo gzip)
+_pages = {}
+_pages_lock = threading.Lock()
+
+def _stamp():
+    """Ciò che invalida le pagine: una nuova build degli asset e, in sviluppo, le modifiche ai template"""
+    if not current_app.debug:
+        return assets.build_id()
+    folder = os.path.join(current_app.root_path, current_app.template_folder)
+    return assets.build_id(), max(entry.stat().st_mtime_ns for entry in os.scandir(folder))
+
+def _page(template):
+    """Pagina renderizzata una volta e servita dalla memoria, con ETag e 304"""
+    stamp = _stamp()
+    with _pages_lock:
+        entry = _pages.get(template)
+    if entry is None or entry[0] != stamp:
+        body = render_template(template).encode()
+        etag = hashlib.sha1(body).hexdigest()
+        entry = (stamp, etag, body, gzip.compress(body, compresslevel=Config.GZIP_LEVEL))
+        with _pages_lock:
+            _pages[template] = entry
+
+    _, etag, body, compressed = entry
+    if 'gzip' in request.accept_encodings:
+        response = Response(compressed, mimetype='text/html')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag, weak=True)
+    else:
+        response = Response(body, mimetype='text/html')
+        response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 @web.route('/')
 def home():
     """Pagina pubblica landing"""
-    return render_template('index.html')
+    return _page('index.html')
 
 @web.route('/login')
 def login():
     """Pagina login"""
-    return render_template('login.html')
+    return _page('login.html')
 
 @web.route('/register')
 def register():
     """Pagina registrazione"""
-    return render_template('register.html')
+    return _page('register.html')
 
 @web.route('/customer')
 @login_required
 @role_required('customer')
 def customer():
     """Dashboard cliente protetta"""
-    return render_template('customer.html')
+    return _page('customer.html')
 
 @web.route('/admin')
 @login_required
 @role_required('admin')
 def admin():
     """Dashboard admin protetta"""
-    return render_template('admin.html')
+    return _page('admin.html')
@@ -0,0 +1,83 @@
+import gzip
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from config import Config
+from tracks import POLYLINE_MIMETYPE
+
+try:
+    import orjson
+except ImportError:  # encoder standard della libreria
+    orjson = None
+
+# Tipi di risposta che vale la pena comprimere
+COMPRESSIBLE = ('application/json', POLYLINE_MIMETYPE, 'text/')
+
+def _default(o):
+    """Tipi restituiti da MySQL: stesse stringhe che prima si ottenevano con str() riga per riga"""
+    if isinstance(o, datetime):
+        return str(o)
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, (time, timedelta)):
+        return str(o)
+    if isinstance(o, Decimal):
+        return float(o)
+    return DefaultJSONProvider.default(o)
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+    def dumps_bytes(obj):
+        """Serializza in JSON (UTF-8) in un solo passaggio"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps_bytes(obj):
+        """Serializza in JSON (UTF-8) in un solo passaggio"""
+        return json.dumps(obj, default=_default, sort_keys=True, separators=(',', ':')).encode()
+
+def dumps(obj):
+    return dumps_bytes(obj).decode()
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Provider JSON dell'app: date, orari, timedelta e Decimal serializzati nativamente,
+    con orjson quando è installato"""
+
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def response(self, *args, **kwargs):
+        # In debug resta l'output indentato del provider standard
+        if self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+def gzip_response(response):
+    """Comprime le risposte non in streaming oltre GZIP_MIN_SIZE byte, se il client accetta gzip"""
+    if (response.status_code != 200
+            or response.is_streamed
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not response.mimetype.startswith(COMPRESSIBLE)
+            or 'gzip' not in request.accept_encodings):
+        return response
+
+    data = response.get_data()
+    if len(data) < Config.GZIP_MIN_SIZE:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=Config.GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # Il corpo compresso è un'altra rappresentazione: l'ETag resta valido solo in confronto debole
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
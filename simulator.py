@@ -0,0 +1,291 @@
+"""Simulatore di voli di droni per generare carico di telemetria.
+
+    python simulator.py fly --drones 20 --missions 50 --rate 1 --duration 600 --create
+    python simulator.py fly --mission-ids 12,13 --url http://localhost:5000 --key $TELEMETRY_KEY
+    python simulator.py replay 123 --speed 10
+
+I punti passano dal percorso di scrittura dell'app: in processo con telemetry.submit (stesso
+database di .env) oppure via HTTP su POST /api/telemetry di un server avviato.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from config import Config
+
+# Hub di partenza dei voli (Milano) e raggio delle consegne in metri
+HUB = (45.4642, 9.19)
+MIN_RANGE = 1000
+MAX_RANGE = 8000
+
+METERS_PER_DEGREE = 111320
+CRUISE_ALTITUDE_TIME = 20  # secondi di decollo/atterraggio quasi sul posto
+GPS_NOISE = 2.0            # deviazione standard in metri
+
+def _offset(origin, north, east):
+    """Punto spostato di north/east metri da origin"""
+    lat = origin[0] + north / METERS_PER_DEGREE
+    lng = origin[1] + east / (METERS_PER_DEGREE * math.cos(math.radians(origin[0])))
+    return lat, lng
+
+def _distance(a, b):
+    """Distanza approssimata in metri (equirettangolare, adeguata su pochi km)"""
+    north = (b[0] - a[0]) * METERS_PER_DEGREE
+    east = (b[1] - a[1]) * METERS_PER_DEGREE * math.cos(math.radians((a[0] + b[0]) / 2))
+    return math.hypot(north, east)
+
+def random_address(rng):
+    """Indirizzo di consegna casuale attorno all'hub"""
+    angle = rng.uniform(0, 2 * math.pi)
+    dist = rng.uniform(MIN_RANGE, MAX_RANGE)
+    return _offset(HUB, dist * math.sin(angle), dist * math.cos(angle))
+
+class Flight:
+    """Volo hub → consegna → hub su una curva leggermente arcuata, a velocità di crociera costante"""
+
+    def __init__(self, rng, mission_id, drone_id, destination=None):
+        self.rng = rng
+        self.mission_id = mission_id
+        self.drone_id = drone_id
+        self.destination = destination or random_address(rng)
+        self.speed = rng.uniform(10, 18)
+        # Punto di controllo della curva: deviazione laterale fino al 15% della distanza
+        length = _distance(HUB, self.destination)
+        bend = rng.uniform(-0.15, 0.15) * length
+        mid = ((HUB[0] + self.destination[0]) / 2, (HUB[1] + self.destination[1]) / 2)
+        dx, dy = self.destination[1] - HUB[1], self.destination[0] - HUB[0]
+        norm = math.hypot(dx, dy) or 1
+        self.control = _offset(mid, bend * dx / norm, -bend * dy / norm)
+        self.leg_time = length / self.speed
+        self.duration = 2 * (self.leg_time + 2 * CRUISE_ALTITUDE_TIME)
+
+    def _on_leg(self, f, outbound):
+        a, b = (HUB, self.destination) if outbound else (self.destination, HUB)
+        c = self.control
+        lat = (1 - f) ** 2 * a[0] + 2 * (1 - f) * f * c[0] + f ** 2 * b[0]
+        lng = (1 - f) ** 2 * a[1] + 2 * (1 - f) * f * c[1] + f ** 2 * b[1]
+        return lat, lng
+
+    def position(self, elapsed):
+        """Posizione (con rumore GPS) dopo `elapsed` secondi, None a volo concluso"""
+        if elapsed > self.duration:
+            return None
+        half = self.duration / 2
+        outbound = elapsed < half
+        t = (elapsed if outbound else elapsed - half) - CRUISE_ALTITUDE_TIME
+        f = min(max(t / self.leg_time, 0.0), 1.0)
+        point = self._on_leg(f, outbound)
+        return _offset(point, self.rng.gauss(0, GPS_NOISE), self.rng.gauss(0, GPS_NOISE))
+
+class LocalSink:
+    """Scrive con telemetry.submit, come l'endpoint di ingestione"""
+
+    def __init__(self):
+        import telemetry
+        self.telemetry = telemetry
+
+    def send(self, rows):
+        return self.telemetry.submit(rows)
+
+    def close(self):
+        self.telemetry.get_writer().flush()
+
+class HttpSink:
+    """Invia i punti a POST /api/telemetry di un server avviato"""
+
+    def __init__(self, url, key):
+        self.url = url.rstrip('/') + '/api/telemetry'
+        self.key = key
+
+    def send(self, rows):
+        body = json.dumps({'points': [
+            {'drone_id': d, 'mission_id': m, 'lat': lat, 'lng': lng, 'timestamp': ts.isoformat()}
+            for d, m, lat, lng, ts in rows
+        ]}).encode()
+        request = urllib.request.Request(self.url, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'X-Telemetry-Key': self.key or ''
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status == 202
+        except urllib.error.HTTPError as e:
+            if e.code == 503:
+                return False
+            raise
+
+    def close(self):
+        pass
+
+class Stats:
+    def __init__(self):
+        self.points = 0
+        self.batches = 0
+        self.rejected = 0
+        self.flights = 0
+        self.started = time.monotonic()
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            'flights': self.flights,
+            'points': self.points,
+            'batches': self.batches,
+            'rejected_points': self.rejected,
+            'seconds': round(elapsed, 1),
+            'points_per_second': round(self.points / elapsed, 1) if elapsed else 0
+        }
+
+def _send(sink, rows, stats):
+    """Invia a lotti di al più TELEMETRY_MAX_BATCH punti; i lotti rifiutati per coda piena vanno persi"""
+    for i in range(0, len(rows), Config.TELEMETRY_MAX_BATCH):
+        batch = rows[i:i + Config.TELEMETRY_MAX_BATCH]
+        stats.batches += 1
+        if sink.send(batch):
+            stats.points += len(batch)
+        else:
+            stats.rejected += len(batch)
+
+def fly(args):
+    """M missioni concorrenti su N droni, con un punto per drone ogni 1/rate secondi"""
+    rng = random.Random(args.seed)
+    drone_ids = [int(i) for i in args.drone_ids.split(',')] if args.drone_ids else list(range(1, args.drones + 1))
+    if args.mission_ids:
+        mission_ids = [int(i) for i in args.mission_ids.split(',')]
+    elif args.create:
+        mission_ids = create_missions(args.missions, drone_ids)
+    else:
+        sys.exit('Indicare --mission-ids oppure --create')
+
+    sink = HttpSink(args.url, args.key) if args.url else LocalSink()
+    stats = Stats()
+    start = time.monotonic()
+    flights = []
+    for i, mission_id in enumerate(mission_ids):
+        flights.append([Flight(rng, mission_id, drone_ids[i % len(drone_ids)]), start])
+        stats.flights += 1
+
+    interval = 1.0 / args.rate
+    tick = start
+    try:
+        while flights and (args.duration is None or tick - start < args.duration):
+            now = datetime.now()
+            rows = []
+            for entry in flights:
+                flight, flight_start = entry
+                point = flight.position((tick - flight_start) * args.speed)
+                if point is None:
+                    if not args.loop:
+                        entry[0] = None
+                        continue
+                    # Carico continuo: nuovo volo sulla stessa missione
+                    entry[0], entry[1] = Flight(rng, flight.mission_id, flight.drone_id), tick
+                    stats.flights += 1
+                    point = entry[0].position(0)
+                rows.append((flight.drone_id, flight.mission_id, round(point[0], 6), round(point[1], 6), now))
+            flights = [entry for entry in flights if entry[0] is not None]
+            if rows:
+                _send(sink, rows, stats)
+
+            tick += interval
+            delay = tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+    print(json.dumps(stats.as_dict()))
+
+def create_missions(count, drone_ids):
+    """Crea `count` missioni in corso per la simulazione e ne ritorna gli ID"""
+    from db import execute, transaction
+    import dashboard
+
+    now = datetime.now()
+    ids = []
+    with transaction():
+        for i in range(count):
+            ids.append(execute(
+                "INSERT INTO Missione (DataMissione, Ora, Stato, IdDrone) VALUES (%s, %s, 'in corso', %s)",
+                (now.date(), now.time().replace(microsecond=0), drone_ids[i % len(drone_ids)])
+            ))
+    dashboard.invalidate()
+    return ids
+
+def replay(args):
+    """Riproduce i punti registrati di una missione a velocità `speed`, con tempi riallineati ad ora"""
+    from db import query_rows
+
+    rows = query_rows("""
+        SELECT ID_Drone, Latitudine, Longitudine, TIMESTAMP
+        FROM Traccia
+        WHERE ID_Missione = %s
+        ORDER BY TIMESTAMP
+    """, (args.mission_id,))
+    if not rows:
+        sys.exit(f'Nessun punto registrato per la missione {args.mission_id}')
+
+    target = args.into or create_missions(1, [rows[0][0]])[0]
+    sink = HttpSink(args.url, args.key) if args.url else LocalSink()
+    stats = Stats()
+    stats.flights = 1
+    first = rows[0][3]
+    start, now = time.monotonic(), datetime.now()
+
+    pending = []
+    try:
+        for drone_id, lat, lng, ts in rows:
+            offset = (ts - first).total_seconds() / args.speed
+            delay = start + offset - time.monotonic()
+            # Punti ravvicinati inviati insieme, come farebbe il drone con un proprio buffer
+            if delay > 0.05 and pending:
+                _send(sink, pending, stats)
+                pending = []
+                delay = start + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pending.append((drone_id, target, float(lat), float(lng), now + timedelta(seconds=offset)))
+        if pending:
+            _send(sink, pending, stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+    print(json.dumps({'mission_id': target, **stats.as_dict()}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='server su cui inviare i punti via HTTP (default: in processo)')
+    parser.add_argument('--key', default=Config.TELEMETRY_KEY, help='X-Telemetry-Key per --url')
+    commands = parser.add_subparsers(required=True)
+
+    p = commands.add_parser('fly', help='voli sintetici hub → consegna → hub')
+    p.add_argument('--drones', type=int, default=10)
+    p.add_argument('--drone-ids', help='ID dei droni separati da virgole (default 1..drones)')
+    p.add_argument('--missions', type=int, default=10, help='missioni concorrenti con --create')
+    p.add_argument('--mission-ids', help='missioni esistenti da usare, separate da virgole')
+    p.add_argument('--create', action='store_true', help='crea le missioni in corso nel database')
+    p.add_argument('--rate', type=float, default=1.0, help='punti al secondo per drone')
+    p.add_argument('--speed', type=float, default=1.0, help='accelerazione del tempo simulato')
+    p.add_argument('--duration', type=float, help='secondi di simulazione (default: fino alla fine dei voli)')
+    p.add_argument('--loop', action='store_true', help='ricomincia un nuovo volo a fine volo')
+    p.add_argument('--seed', type=int, default=42)
+    p.set_defaults(func=fly)
+
+    p = commands.add_parser('replay', help='riproduce una missione registrata')
+    p.add_argument('mission_id', type=int)
+    p.add_argument('--speed', type=float, default=1.0, help='fattore di accelerazione (k×)')
+    p.add_argument('--into', type=int, help='missione su cui scrivere (default: una nuova)')
+    p.set_defaults(func=replay)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,10 @@
 let allDrones = [];
 let allPilots = [];
 let allMissions = [];
+let missionsCursor = null;
+let missionsLoading = false;
+let missionsQuery = '';
+let missionsObserver = null;
 let statsChart = null;
 
 // ===== DASHBOARD KPI =====
@@ -206,59 +210,108 @@ document.getElementById('pilotForm')?.addEventListener('submit', async (e) => {
 });
 
 // ===== GESTIONE MISSIONI =====
+function missionFilters() {
+    const stato = document.getElementById('f_stato').value;
+    const pilotaId = document.getElementById('f_pilota').value;
+    const droneId = document.getElementById('f_drone').value;
+    const dal = document.getElementById('f_dal').value;
+    const al = document.getElementById('f_al').value;
+    
+    const params = new URLSearchParams();
+    if (stato) params.append('stato', stato);
+    if (pilotaId) params.append('pilota_id', pilotaId);
+    if (droneId) params.append('drone_id', droneId);
+    if (dal) params.append('dal', dal);
+    if (al) params.append('al', al);
+    return params;
+}
+
+function renderMissionRow(mission) {
+    const statusClass = mission.status === 'in corso' ? 'warning' : 
+                       mission.status === 'completata' ? 'success' : 'danger';
+    
+    return `
+        <tr>
+            <td>${mission.id}</td>
+            <td>${mission.date}</td>
+            <td>${mission.time}</td>
+            <td>${mission.drone_model || 'N/A'}</td>
+            <td>${mission.pilot_name || 'N/A'}</td>
+            <td>
+                <select class="form-select form-select-sm" onchange="updateMissionStatus(${mission.id}, this.value)">
+                    <option value="in corso" ${mission.status === 'in corso' ? 'selected' : ''}>In corso</option>
+                    <option value="completata" ${mission.status === 'completata' ? 'selected' : ''}>Completata</option>
+                    <option value="annullata" ${mission.status === 'annullata' ? 'selected' : ''}>Annullata</option>
+                </select>
+            </td>
+            <td>${mission.rating ? mission.rating + '/10' : '-'}</td>
+            <td>
+                <span class="badge bg-${statusClass}">${mission.status}</span>
+            </td>
+        </tr>
+    `;
+}
+
+// Prima pagina con i filtri correnti
 async function loadMissions() {
+    missionsQuery = missionFilters().toString();
+    missionsCursor = null;
+    allMissions = [];
+    await loadMoreMissions(true);
+}
+
+// Pagina successiva (keyset), caricata quando la tabella scorre in fondo
+async function loadMoreMissions(reset = false) {
+    if (missionsLoading || (!reset && !missionsCursor)) return;
+    missionsLoading = true;
+    
     try {
-        const stato = document.getElementById('f_stato').value;
-        const pilotaId = document.getElementById('f_pilota').value;
-        const droneId = document.getElementById('f_drone').value;
-        const dal = document.getElementById('f_dal').value;
-        const al = document.getElementById('f_al').value;
+        const query = missionsQuery;
+        const params = new URLSearchParams(query);
+        if (missionsCursor) params.append('cursor', missionsCursor);
         
-        const params = new URLSearchParams();
-        if (stato) params.append('stato', stato);
-        if (pilotaId) params.append('pilota_id', pilotaId);
-        if (droneId) params.append('drone_id', droneId);
-        if (dal) params.append('dal', dal);
-        if (al) params.append('al', al);
+        const page = await api('/api/admin/missions?' + params.toString());
+        
+        // Filtri cambiati durante la richiesta
+        if (query !== missionsQuery) return;
         
-        allMissions = await api('/api/admin/missions?' + params.toString());
         const tbody = document.getElementById('missionsTable');
+        if (reset) tbody.innerHTML = '';
+        
+        allMissions = allMissions.concat(page.items);
+        missionsCursor = page.next_cursor;
         
         if (allMissions.length === 0) {
             tbody.innerHTML = '<tr><td colspan="8" class="text-center text-muted">Nessuna missione trovata</td></tr>';
             return;
         }
         
-        tbody.innerHTML = allMissions.map(mission => {
-            const statusClass = mission.status === 'in corso' ? 'warning' : 
-                               mission.status === 'completata' ? 'success' : 'danger';
-            
-            return `
-                <tr>
-                    <td>${mission.id}</td>
-                    <td>${mission.date}</td>
-                    <td>${mission.time}</td>
-                    <td>${mission.drone_model || 'N/A'}</td>
-                    <td>${mission.pilot_name || 'N/A'}</td>
-                    <td>
-                        <select class="form-select form-select-sm" onchange="updateMissionStatus(${mission.id}, this.value)">
-                            <option value="in corso" ${mission.status === 'in corso' ? 'selected' : ''}>In corso</option>
-                            <option value="completata" ${mission.status === 'completata' ? 'selected' : ''}>Completata</option>
-                            <option value="annullata" ${mission.status === 'annullata' ? 'selected' : ''}>Annullata</option>
-                        </select>
-                    </td>
-                    <td>${mission.rating ? mission.rating + '/10' : '-'}</td>
-                    <td>
-                        <span class="badge bg-${statusClass}">${mission.status}</span>
-                    </td>
-                </tr>
-            `;
-        }).join('');
+        tbody.insertAdjacentHTML('beforeend', page.items.map(renderMissionRow).join(''));
     } catch (error) {
         console.error('Errore caricamento missioni:', error);
+    } finally {
+        missionsLoading = false;
+        
+        // Se il fondo è ancora visibile, l'observer riparte e chiede un'altra pagina
+        const sentinel = document.getElementById('missionsSentinel');
+        if (missionsObserver && sentinel) {
+            missionsObserver.unobserve(sentinel);
+            missionsObserver.observe(sentinel);
+        }
     }
 }
 
+// Carica la pagina successiva quando il fondo della tabella diventa visibile
+function observeMissionsEnd() {
+    const sentinel = document.getElementById('missionsSentinel');
+    if (!sentinel || !window.IntersectionObserver) return;
+    
+    missionsObserver = new IntersectionObserver((entries) => {
+        if (entries.some(e => e.isIntersecting)) loadMoreMissions();
+    });
+    missionsObserver.observe(sentinel);
+}
+
 async function updateMissionStatus(missionId, newStatus) {
     try {
         await api(`/api/admin/missions/${missionId}`, 'PUT', { status: newStatus });
@@ -283,39 +336,18 @@ function populateDroneFilter() {
         allDrones.map(d => `<option value="${d.id}">${d.model}</option>`).join('');
 }
 
+// Esportazione generata in streaming dal server con i filtri correnti
 function exportCSV() {
-    if (allMissions.length === 0) {
-        alert('Nessun dato da esportare');
-        return;
-    }
-    
-    const headers = ['ID', 'Data', 'Ora', 'Drone', 'Pilota', 'Stato', 'Valutazione'];
-    const rows = allMissions.map(m => [
-        m.id,
-        m.date,
-        m.time,
-        m.drone_model || '',
-        m.pilot_name || '',
-        m.status,
-        m.rating || ''
-    ]);
-    
-    let csv = headers.join(',') + '\n';
-    csv += rows.map(row => row.join(',')).join('\n');
-    
-    const blob = new Blob([csv], { type: 'text/csv' });
-    const url = URL.createObjectURL(blob);
-    const a = document.createElement('a');
-    a.href = url;
-    a.download = `missioni_${new Date().toISOString().split('T')[0]}.csv`;
-    a.click();
-    URL.revokeObjectURL(url);
+    const params = missionFilters();
+    params.append('format', 'csv');
+    window.location.href = '/api/admin/missions/export?' + params.toString();
 }
 
 // ===== STATISTICHE =====
 async function loadStats() {
     try {
-        const data = await api('/api/admin/stats');
+        const days = document.getElementById('s_giorni')?.value || 10;
+        const data = await api(`/api/admin/stats?days=${days}`);
         
         const ctx = document.getElementById('statsChart');
         
@@ -369,6 +401,7 @@ document.addEventListener('DOMContentLoaded', () => {
     loadDrones();
     loadPilots();
     loadMissions();
+    observeMissionsEnd();
     
     // Event listener per cambio tab
     document.getElementById('stats-tab')?.addEventListener('shown.bs.tab', () => {
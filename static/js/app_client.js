@@ -1,22 +1,47 @@
 // Variabili globali
 let map = null;
 let trackingInterval = null;
+let trackingSource = null;
 let currentMissionId = null;
 let polyline = null;
 let marker = null;
+let trackCursor = null;
+let trackEtag = null;
+// Punti già disegnati: le letture incrementali rileggono una finestra prima del cursore
+const trackSeen = new Set();
+let routeMissionId = null;
+let ordersCursor = null;
+let ordersLoading = false;
+let ordersObserver = null;
+const orderDetails = new Map();
+const ORDER_DETAIL_TTL = 30000;
 
-// Carica ordini del cliente
+// Carica ordini del cliente (prima pagina)
 async function loadOrders() {
+    ordersCursor = null;
+    await loadMoreOrders(true);
+}
+
+// Pagina successiva di ordini (keyset)
+async function loadMoreOrders(reset = false) {
+    if (ordersLoading || (!reset && !ordersCursor)) return;
+    ordersLoading = true;
+    
+    const ordersList = document.getElementById('ordersList');
+    
     try {
-        const orders = await api('/api/orders');
-        const ordersList = document.getElementById('ordersList');
+        const params = new URLSearchParams();
+        if (ordersCursor) params.append('cursor', ordersCursor);
+        
+        const page = await api('/api/orders?' + params.toString());
+        ordersCursor = page.next_cursor;
         
-        if (orders.length === 0) {
+        if (reset && page.items.length === 0) {
             ordersList.innerHTML = '<p class="text-center text-muted py-3">Nessun ordine trovato</p>';
             return;
         }
         
-        ordersList.innerHTML = orders.map(order => {
+        const html = page.items.map(order => {
             const statusClass = order.status === 'in corso' ? 'warning' : 
                                order.status === 'completata' ? 'success' : 
                                order.status === 'annullata' ? 'danger' : 'secondary';
@@ -33,20 +58,71 @@ async function loadOrders() {
                 </div>
             `;
         }).join('');
+        
+        if (reset) ordersList.innerHTML = '';
+        ordersList.insertAdjacentHTML('beforeend', html);
+        
+        // Dettagli della pagina in una sola richiesta, senza attendere
+        prefetchOrderDetails(page.items.map(o => o.id));
     } catch (error) {
         console.error('Errore caricamento ordini:', error);
-        document.getElementById('ordersList').innerHTML = 
-            '<p class="text-center text-danger py-3">Errore caricamento ordini</p>';
+        if (reset) {
+            ordersList.innerHTML = 
+                '<p class="text-center text-danger py-3">Errore caricamento ordini</p>';
+        }
+    } finally {
+        ordersLoading = false;
+        
+        // Se il fondo della lista è ancora visibile, chiedi un'altra pagina
+        const sentinel = document.getElementById('ordersSentinel');
+        if (ordersObserver && sentinel) {
+            ordersObserver.unobserve(sentinel);
+            ordersObserver.observe(sentinel);
+        }
+    }
+}
+
+// Carica la pagina successiva quando la lista scorre in fondo
+function observeOrdersEnd() {
+    const sentinel = document.getElementById('ordersSentinel');
+    if (!sentinel || !window.IntersectionObserver) return;
+    
+    ordersObserver = new IntersectionObserver((entries) => {
+        if (entries.some(e => e.isIntersecting)) loadMoreOrders();
+    });
+    ordersObserver.observe(sentinel);
+}
+
+// Precarica i dettagli di più ordini con una sola chiamata
+async function prefetchOrderDetails(orderIds) {
+    if (orderIds.length === 0) return;
+    
+    try {
+        const details = await api(`/api/orders/details?ids=${orderIds.join(',')}`);
+        const now = Date.now();
+        details.forEach(d => orderDetails.set(d.order.id, { data: d, at: now }));
+    } catch (error) {
+        console.error('Errore prefetch dettagli ordini:', error);
     }
 }
 
+// Dettaglio ordine dalla cache se recente, altrimenti dal server
+async function getOrderDetail(orderId) {
+    const cached = orderDetails.get(orderId);
+    if (cached && Date.now() - cached.at < ORDER_DETAIL_TTL) return cached.data;
+    
+    const data = await api(`/api/orders/${orderId}`);
+    orderDetails.set(orderId, { data, at: Date.now() });
+    return data;
+}
+
 // Seleziona e mostra dettaglio ordine
 async function selectOrder(orderId) {
     try {
         // Ferma tracking precedente
         stopTracking();
         
-        const data = await api(`/api/orders/${orderId}`);
+        const data = await getOrderDetail(orderId);
         
         // Nascondi placeholder
         document.getElementById('selectOrderPlaceholder').classList.add('d-none');
@@ -98,6 +174,10 @@ async function selectOrder(orderId) {
                 currentMissionId = data.order.mission_id;
                 showMap();
                 startTracking(data.order.mission_id);
+            } else if (data.mission.status === 'completata' && data.order.mission_id) {
+                // Percorso effettuato, semplificato in base allo zoom
+                showMap();
+                showRoute(data.order.mission_id);
             } else {
                 hideMap();
             }
@@ -129,6 +209,11 @@ function showMap() {
         L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
             attribution: '© OpenStreetMap contributors'
         }).addTo(map);
+        
+        // Ricarica il percorso semplificato al nuovo livello di zoom
+        map.on('zoomend', () => {
+            if (routeMissionId) showRoute(routeMissionId, false);
+        });
     }
     
     setTimeout(() => map.invalidateSize(), 100);
@@ -144,21 +229,78 @@ function hideMap() {
 function startTracking(missionId) {
     stopTracking();
     
+    // Stream SSE quando supportato, altrimenti polling
+    if (window.EventSource) {
+        startStream(missionId);
+    } else {
+        startPolling(missionId);
+    }
+}
+
+// Tracking con polling incrementale ogni 3 secondi
+function startPolling(missionId) {
     // Prima chiamata immediata
     updateTrack(missionId);
     
-    // Polling ogni 3 secondi
     trackingInterval = setInterval(() => updateTrack(missionId), 3000);
 }
 
+// Tracking via Server-Sent Events
+function startStream(missionId) {
+    const source = new EventSource(`/api/missions/${missionId}/tracks/stream`);
+    trackingSource = source;
+    
+    // Traccia completa all'apertura (e a ogni riconnessione)
+    source.addEventListener('snapshot', (e) => {
+        clearTrack();
+        drawPoints(JSON.parse(e.data));
+    });
+    
+    source.addEventListener('points', (e) => drawPoints(JSON.parse(e.data)));
+    
+    source.addEventListener('status', (e) => {
+        const { status } = JSON.parse(e.data);
+        if (!status) return;
+        const statusBadge = document.getElementById('detailStatus');
+        statusBadge.textContent = status;
+        statusBadge.className = 'badge bg-' + (
+            status === 'in corso' ? 'warning' : 
+            status === 'completata' ? 'success' : 
+            status === 'annullata' ? 'danger' : 'secondary'
+        );
+    });
+    
+    // Missione terminata: il server chiude lo stream
+    source.addEventListener('end', () => {
+        source.close();
+        if (trackingSource === source) trackingSource = null;
+    });
+    
+    // Stream non disponibile: ripiega sul polling
+    source.onerror = () => {
+        if (trackingSource !== source || source.readyState !== EventSource.CLOSED) return;
+        trackingSource = null;
+        startPolling(missionId);
+    };
+}
+
 // Ferma tracking
 function stopTracking() {
     if (trackingInterval) {
         clearInterval(trackingInterval);
         trackingInterval = null;
     }
+    if (trackingSource) {
+        trackingSource.close();
+        trackingSource = null;
+    }
+    routeMissionId = null;
     
-    // Pulisci mappa
+    clearTrack();
+}
+
+// Pulisci mappa e cursore incrementale
+function clearTrack() {
     if (polyline) {
         map.removeLayer(polyline);
         polyline = null;
@@ -167,38 +309,147 @@ function stopTracking() {
         map.removeLayer(marker);
         marker = null;
     }
+    
+    trackCursor = null;
+    trackEtag = null;
+    trackSeen.clear();
 }
 
-// Aggiorna traccia sulla mappa
+// Aggiorna traccia sulla mappa (solo i punti nuovi)
 async function updateTrack(missionId) {
     try {
-        const tracks = await api(`/api/missions/${missionId}/tracks`);
-        
-        if (tracks.length === 0) return;
+        const params = new URLSearchParams({ format: 'polyline' });
+        if (trackCursor) params.append('since', trackCursor);
+        const headers = trackEtag ? { 'If-None-Match': trackEtag } : {};
         
-        // Rimuovi traccia precedente
-        if (polyline) map.removeLayer(polyline);
-        if (marker) map.removeLayer(marker);
+        const response = await fetch(`/api/missions/${missionId}/tracks?${params}`, {
+            headers,
+            credentials: 'include'
+        });
         
-        // Converti in coordinate Leaflet
-        const latLngs = tracks.map(t => [t.lat, t.lng]);
+        // Nessun nuovo punto dall'ultimo aggiornamento
+        if (response.status === 304) return;
         
-        // Disegna polyline
-        polyline = L.polyline(latLngs, { color: 'blue', weight: 3 }).addTo(map);
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Errore nella richiesta');
+        }
         
-        // Marker sull'ultimo punto
-        const lastPoint = tracks[tracks.length - 1];
-        marker = L.marker([lastPoint.lat, lastPoint.lng])
-            .addTo(map)
-            .bindPopup(`🚁 Drone<br>Ultimo aggiornamento: ${lastPoint.timestamp}`);
+        // Tracking fermato o cambiato durante la richiesta
+        if (missionId !== currentMissionId || !trackingInterval) return;
         
-        // Zoom su traccia
-        map.fitBounds(polyline.getBounds(), { padding: [50, 50] });
+        trackEtag = response.headers.get('ETag');
+        drawPoints(decodeTrack(data));
     } catch (error) {
         console.error('Errore aggiornamento traccia:', error);
     }
 }
 
+// Percorso di una missione conclusa
+async function showRoute(missionId, fit = true) {
+    if (fit) stopTracking();
+    routeMissionId = missionId;
+    
+    try {
+        const data = await api(`/api/missions/${missionId}/tracks?zoom=${map.getZoom()}&format=polyline`);
+        
+        // Selezione cambiata durante la richiesta
+        if (routeMissionId !== missionId) return;
+        
+        clearTrack();
+        drawPoints(decodeTrack(data), fit);
+    } catch (error) {
+        console.error('Errore caricamento percorso:', error);
+    }
+}
+
+// Decodifica interi delta dal formato Google encoded polyline
+function decodeVarints(encoded) {
+    const values = [];
+    let index = 0;
+    
+    while (index < encoded.length) {
+        let result = 0;
+        let shift = 0;
+        let byte;
+        do {
+            byte = encoded.charCodeAt(index++) - 63;
+            result |= (byte & 0x1f) << shift;
+            shift += 5;
+        } while (byte >= 0x20);
+        values.push(result & 1 ? ~(result >> 1) : result >> 1);
+    }
+    
+    return values;
+}
+
+// Timestamp UNIX nel formato del server (AAAA-MM-GG hh:mm:ss)
+function formatTimestamp(seconds) {
+    return new Date(seconds * 1000).toISOString().slice(0, 19).replace('T', ' ');
+}
+
+// Decodifica la traccia compatta (?format=polyline) in punti {lat, lng, timestamp}
+function decodeTrack(data) {
+    const coords = decodeVarints(data.polyline);
+    const times = decodeVarints(data.times);
+    const tracks = [];
+    let lat = 0;
+    let lng = 0;
+    let time = data.start;
+    
+    for (let i = 0; i < data.count; i++) {
+        lat += coords[2 * i];
+        lng += coords[2 * i + 1];
+        time += times[i];
+        tracks.push({ lat: lat / 1e5, lng: lng / 1e5, timestamp: formatTimestamp(time) });
+    }
+    
+    // Cursore esatto per le richieste incrementali
+    if (tracks.length > 0) tracks[tracks.length - 1].timestamp = data.last;
+    
+    return tracks;
+}
+
+// Chiave di un punto, uguale per i punti da SSE e da polyline (precisione 1e-5)
+function pointKey(t) {
+    return `${t.timestamp}|${t.lat.toFixed(4)}|${t.lng.toFixed(4)}`;
+}
+
+// Accoda nuovi punti alla polyline e sposta il marker
+function drawPoints(tracks, fit = true) {
+    // Il cursore avanza al timestamp più recente ricevuto, anche se già disegnato
+    for (const t of tracks) {
+        if (!trackCursor || t.timestamp > trackCursor) trackCursor = t.timestamp;
+    }
+    tracks = tracks.filter(t => !trackSeen.has(pointKey(t)));
+    if (tracks.length === 0) return;
+    tracks.forEach(t => trackSeen.add(pointKey(t)));
+    
+    // Converti in coordinate Leaflet
+    const latLngs = tracks.map(t => [t.lat, t.lng]);
+    
+    // Accoda i nuovi punti alla polyline esistente
+    if (polyline) {
+        latLngs.forEach(p => polyline.addLatLng(p));
+    } else {
+        polyline = L.polyline(latLngs, { color: 'blue', weight: 3 }).addTo(map);
+    }
+    
+    // Marker sull'ultimo punto
+    const lastPoint = tracks[tracks.length - 1];
+    const popup = `🚁 Drone<br>Ultimo aggiornamento: ${lastPoint.timestamp}`;
+    if (marker) {
+        marker.setLatLng([lastPoint.lat, lastPoint.lng]).setPopupContent(popup);
+    } else {
+        marker = L.marker([lastPoint.lat, lastPoint.lng])
+            .addTo(map)
+            .bindPopup(popup);
+    }
+    
+    // Zoom su traccia
+    if (fit) map.fitBounds(polyline.getBounds(), { padding: [50, 50] });
+}
+
 // Carica valutazione missione
 async function loadMissionRating(missionId) {
     try {
@@ -243,8 +494,9 @@ document.getElementById('submitRatingForm')?.addEventListener('submit', async (e
         document.getElementById('ratingForm').classList.add('d-none');
         
         // Ricarica dettaglio
-        const orderId = document.getElementById('detailOrderId').textContent;
-        selectOrder(parseInt(orderId));
+        const orderId = parseInt(document.getElementById('detailOrderId').textContent);
+        orderDetails.delete(orderId);
+        selectOrder(orderId);
     } catch (error) {
         alert('Errore invio valutazione: ' + error.message);
     }
@@ -253,4 +505,5 @@ document.getElementById('submitRatingForm')?.addEventListener('submit', async (e
 // Inizializzazione
 document.addEventListener('DOMContentLoaded', () => {
     loadOrders();
+    observeOrdersEnd();
 });
@@ -0,0 +1,209 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from mysql.connector import errorcode, DataError, Error, IntegrityError, InterfaceError, OperationalError
+from config import Config
+from db import execute_many
+from pool import PoolTimeout
+import live
+
+logger = logging.getLogger(__name__)
+
+INSERT_TRACCIA = """
+    INSERT INTO Traccia (ID_Drone, ID_Missione, Latitudine, Longitudine, TIMESTAMP)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+# Errori del server che passano ripetendo la stessa scrittura
+TRANSIENT_ERRNOS = (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+# Valori rifiutati in modalità strict con SQLSTATE generico (HY000) invece che 22xxx
+INVALID_VALUE_ERRNOS = (errorcode.ER_TRUNCATED_WRONG_VALUE_FOR_FIELD, errorcode.ER_TRUNCATED_WRONG_VALUE)
+
+def _transient(e):
+    if isinstance(e, (InterfaceError, OperationalError, PoolTimeout)):
+        return True
+    return isinstance(e, Error) and e.errno in TRANSIENT_ERRNOS
+
+def _invalid_rows(e):
+    """Errore causato dal contenuto di una o più righe: ripetere l'intero blocco non serve"""
+    if isinstance(e, (IntegrityError, DataError)):
+        return True
+    return isinstance(e, Error) and e.errno in INVALID_VALUE_ERRNOS
+
+class TelemetryWriter:
+    """Buffer limitato di punti GPS scritto in blocco da un thread in background"""
+
+    def __init__(self, capacity, batch_size, flush_interval, retries=0, retry_delay=0):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.accepted = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+
+    def start(self):
+        """Avvia il writer (una sola volta)"""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='telemetry-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, rows, timeout):
+        """Accoda un lotto di righe; con buffer pieno attende fino a timeout (backpressure)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._buffer) + len(rows) > self.capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping:
+                    self.dropped += len(rows)
+                    return False
+                self._cond.wait(remaining)
+            self._buffer.extend(rows)
+            self.accepted += len(rows)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _take(self):
+        """Attende la soglia di dimensione o di tempo e preleva un blocco dal buffer"""
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._buffer) < self.batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(len(self._buffer), self.batch_size)
+            batch = [self._buffer.popleft() for _ in range(count)]
+            # Libera spazio per i produttori in attesa
+            self._cond.notify_all()
+            return batch
+
+    def _write(self, batch):
+        """Scrive un blocco e sveglia gli stream live delle missioni coinvolte"""
+        written = self._insert(batch)
+        with self._cond:
+            self.flushed += len(written)
+            self.batches += 1
+        # Gli stream live delle missioni coinvolte ricevono subito i nuovi punti
+        for mission_id in {row[1] for row in written}:
+            live.notify(mission_id)
+
+    def _insert(self, rows):
+        """Inserisce le righe e ritorna quelle scritte. Gli errori transitori (connessione persa,
+        deadlock, lock wait) sono ripetuti con attesa crescente; con righe non valide (drone o
+        missione inesistente, valori fuori intervallo) il blocco è diviso a metà finché restano
+        escluse solo quelle"""
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                execute_many(INSERT_TRACCIA, rows)
+                return rows
+            except Exception as e:
+                with self._cond:
+                    self.errors += 1
+                if _invalid_rows(e):
+                    if len(rows) == 1:
+                        logger.warning('Punto di telemetria scartato %s: %s', rows[0], e)
+                        with self._cond:
+                            self.dropped += 1
+                        return []
+                    half = len(rows) // 2
+                    return self._insert(rows[:half]) + self._insert(rows[half:])
+                if not _transient(e) or attempt == self.retries:
+                    logger.exception('Scrittura di %d punti di telemetria fallita dopo %d tentativi',
+                                     len(rows), attempt + 1)
+                    with self._cond:
+                        self.dropped += len(rows)
+                    return []
+                logger.warning('Scrittura di %d punti di telemetria fallita, nuovo tentativo tra %.1f s',
+                               len(rows), delay, exc_info=True)
+                # Intanto il buffer si riempie e i produttori ricevono backpressure
+                time.sleep(delay)
+                delay *= 2
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch:
+                self._write(batch)
+            elif self._stopping:
+                return
+
+    def flush(self):
+        """Scrive tutto il contenuto del buffer (usato alla chiusura del processo)"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        while True:
+            with self._cond:
+                count = min(len(self._buffer), self.batch_size)
+                batch = [self._buffer.popleft() for _ in range(count)]
+            if not batch:
+                return
+            self._write(batch)
+
+    def stats(self):
+        """Contatori del writer"""
+        with self._cond:
+            return {
+                'queued': len(self._buffer),
+                'capacity': self.capacity,
+                'accepted': self.accepted,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'batches': self.batches,
+                'errors': self.errors
+            }
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    """Writer di processo, avviato al primo utilizzo"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = TelemetryWriter(
+                Config.TELEMETRY_QUEUE_SIZE,
+                Config.TELEMETRY_BATCH_SIZE,
+                Config.TELEMETRY_FLUSH_INTERVAL,
+                Config.TELEMETRY_RETRIES,
+                Config.TELEMETRY_RETRY_DELAY
+            )
+            _writer.start()
+        return _writer
+
+def _flush_at_exit():
+    # Legge la variabile globale: dopo un fork il figlio scrive solo il proprio buffer
+    if _writer is not None:
+        _writer.flush()
+
+def _reset_after_fork():
+    """Il thread del writer non sopravvive al fork e il buffer copiato è già del padre"""
+    global _writer, _writer_lock
+    _writer = None
+    _writer_lock = threading.Lock()
+
+atexit.register(_flush_at_exit)
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def submit(rows):
+    """Accoda righe (ID_Drone, ID_Missione, lat, lng, timestamp) con backpressure"""
+    return get_writer().submit(rows, Config.TELEMETRY_SUBMIT_TIMEOUT)
+
+def stats():
+    """Contatori di ingestione, anche se il writer non è ancora partito"""
+    writer = _writer or TelemetryWriter(Config.TELEMETRY_QUEUE_SIZE, 0, 0)
+    return writer.stats()
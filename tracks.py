@@ -0,0 +1,134 @@
+import math
+import struct
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import Config
+
+# Formati compatti della traccia
+POLYLINE_MIMETYPE = 'application/vnd.droni.polyline+json'
+BINARY_MIMETYPE = 'application/octet-stream'
+
+# Intestazione del formato binario: numero di punti (uint32) e timestamp iniziale (int64, secondi)
+BINARY_HEADER = struct.Struct('<Iq')
+
+# Cache LRU delle tracce semplificate di missioni concluse: chiave -> (etag, contenuto)
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def tolerance_for_zoom(zoom):
+    """Tolleranza in gradi Mercatore corrispondente a pochi pixel al livello di zoom dato"""
+    return Config.TRACK_SIMPLIFY_PIXELS * 360.0 / (256 * 2 ** zoom)
+
+def _project(lat, lng):
+    """Proietta lat/lng in Web Mercator (gradi) come array Nx2"""
+    lat = np.radians(np.clip(lat, -85.0511, 85.0511))
+    y = np.degrees(np.log(np.tan(np.pi / 4 + lat / 2)))
+    return np.column_stack((lng, y))
+
+def douglas_peucker(points, tolerance):
+    """Maschera dei punti da mantenere secondo Douglas-Peucker (iterativo, distanze vettorizzate)"""
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n < 3:
+        keep[:] = True
+        return keep
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        a = points[start]
+        dx, dy = points[end] - a
+        inner = points[start + 1:end] - a
+        length = math.hypot(dx, dy)
+
+        # Distanza perpendicolare dal segmento start-end (o dal punto se coincidono)
+        if length == 0:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(dx * inner[:, 1] - dy * inner[:, 0]) / length
+
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+def simplify(tracks, tolerance):
+    """Semplifica una lista di punti {lat, lng, timestamp} mantenendo primo e ultimo"""
+    if len(tracks) < 3 or tolerance <= 0:
+        return tracks
+    lat = np.array([t['lat'] for t in tracks], dtype=float)
+    lng = np.array([t['lng'] for t in tracks], dtype=float)
+    keep = douglas_peucker(_project(lat, lng), tolerance)
+    return [tracks[i] for i in np.flatnonzero(keep)]
+
+def columns(rows, tolerance=None):
+    """Converte righe (lat, lng, timestamp) in colonne NumPy, semplificate se richiesto"""
+    n = len(rows)
+    lat = np.fromiter((r[0] for r in rows), dtype=float, count=n)
+    lng = np.fromiter((r[1] for r in rows), dtype=float, count=n)
+    secs = np.array([r[2] for r in rows], dtype='datetime64[s]').astype(np.int64)
+    if tolerance and n > 2:
+        keep = douglas_peucker(_project(lat, lng), tolerance)
+        lat, lng, secs = lat[keep], lng[keep], secs[keep]
+    return lat, lng, secs
+
+def _deltas(values, scale):
+    """Valori interi scalati codificati come differenze dal precedente (il primo è assoluto)"""
+    ints = np.round(values * scale).astype(np.int64)
+    return np.diff(ints, prepend=0)
+
+def _encode_varints(deltas):
+    """Codifica una sequenza di interi nel formato Google encoded polyline"""
+    out = bytearray()
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            out.append((0x20 | (value & 0x1f)) + 63)
+            value >>= 5
+        out.append(value + 63)
+    return out.decode('ascii')
+
+def encode_polyline(lat, lng, secs):
+    """Traccia come encoded polyline (precisione 1e-5) più tempi delta-codificati in secondi"""
+    coords = np.column_stack((_deltas(lat, 1e5), _deltas(lng, 1e5))).ravel()
+    return {
+        'count': len(lat),
+        'polyline': _encode_varints(coords),
+        'times': _encode_varints(np.diff(secs, prepend=secs[:1])) if len(secs) else '',
+        'start': int(secs[0]) if len(secs) else None
+    }
+
+def encode_binary(lat, lng, secs):
+    """Traccia in binario little-endian: intestazione, poi colonne int32 di delta lat, lng (1e-7) e tempo"""
+    start = int(secs[0]) if len(secs) else 0
+    return b''.join((
+        BINARY_HEADER.pack(len(lat), start),
+        _deltas(lat, 1e7).astype('<i4').tobytes(),
+        _deltas(lng, 1e7).astype('<i4').tobytes(),
+        np.diff(secs, prepend=start).astype('<i4').tobytes()
+    ))
+
+def cache_get(key, etag):
+    """Contenuto in cache, solo se ancora valido per l'etag corrente"""
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None or entry[0] != etag:
+            return None
+        _cache.move_to_end(key)
+        return entry[1]
+
+def cache_put(key, etag, value):
+    """Memorizza un contenuto rimuovendo le voci meno recenti"""
+    with _cache_lock:
+        _cache[key] = (etag, value)
+        _cache.move_to_end(key)
+        while len(_cache) > Config.TRACK_CACHE_SIZE:
+            _cache.popitem(last=False)